@@ -1,22 +1,19 @@
 import streamlit as st
+from streamlit.errors import StreamlitAPIException
 import pandas as pd
-from PIL import Image
-import plotly.express as px
-import plotly.graph_objects as go
+import pyarrow as pa
+import pyarrow.compute
 from datetime import datetime
-import json
-import traceback
-import tempfile
 import os
 import uuid
+import hashlib
+import pickle
+import shutil
+import tempfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 # === Internal Modules === #
-from utils.mysql_connector import MySQLConnector
-from utils.postgres_connector import PostgreSQLConnector
-from utils.sqlite_connector import SQLiteConnector
-from nlp.context_aware_processor import ContextAwareQueryProcessor
-from nlp.session_manager import SessionManager
-from visualization.chart_generator import ChartGenerator
 from utils.error_handler import ErrorHandler
 from utils.logger import Logger
 
@@ -28,51 +25,21 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-# === Custom CSS === #
-st.markdown("""
-<style>
-    .chat-message {
-        padding: 1rem;
-        border-radius: 0.5rem;
-        margin: 0.5rem 0;
-        display: flex;
-        align-items: flex-start;
-        overflow-wrap: anywhere;
-        word-wrap: break-word;
-        width: 100%;
-    }
-    .user-message {
-        background-color: #e3f2fd;
-        border-left: 4px solid #2196f3;
-    }
-    .bot-message {
-        background-color: #f1f8e9;
-        border-left: 4px solid #4caf50;
-    }
-    .context-message {
-        background-color: #fff3e0;
-        border-left: 4px solid #ff9800;
-        font-size: 0.9em;
-    }
-    .error-message {
-        background-color: #ffebee;
-        border-left: 4px solid #f44336;
-    }
-    .session-info {
-        background-color: #f5f5f5;
-        padding: 0.5rem;
-        border-radius: 0.3rem;
-        margin: 0.5rem 0;
-        font-size: 0.8em;
-    }
-</style>
-""", unsafe_allow_html=True)
+# Chat messages kept in memory; older ones are spilled to disk
+MAX_CHAT_MESSAGES = 20
+HISTORY_ARCHIVE_DIR = os.path.join(tempfile.gettempdir(), "dataviz_history")
 
 # === Initialize Session State === #
 if 'session_id' not in st.session_state:
     st.session_state.session_id = str(uuid.uuid4())
 if 'messages' not in st.session_state:
-    st.session_state.messages = []
+    st.session_state.messages = deque(maxlen=MAX_CHAT_MESSAGES)
+if 'archived_messages' not in st.session_state:
+    st.session_state.archived_messages = []
+if 'chat_submissions' not in st.session_state:
+    st.session_state.chat_submissions = 0
+if 'last_processed_submission' not in st.session_state:
+    st.session_state.last_processed_submission = 0
 if 'db_connector' not in st.session_state:
     st.session_state.db_connector = None
 if 'query_processor' not in st.session_state:
@@ -81,6 +48,195 @@ if 'session_manager' not in st.session_state:
     st.session_state.session_manager = None
 if 'db_type' not in st.session_state:
     st.session_state.db_type = None
+if 'connection_key' not in st.session_state:
+    st.session_state.connection_key = None
+
+# === Cached Resources === #
+@st.cache_resource(show_spinner=False)
+def get_connector(db_type: str, database: str, host: str = "", port: int = 0,
+                  username: str = "", password_digest: str = "", _password: str = "", _uploaded_file=None):
+    """Create a database connector once per connection key and reuse it across reruns."""
+    # Underscore parameters are left out of the cache key, so it only carries a digest of the password
+    # Driver stacks are imported only for the database type actually used
+    if db_type == "postgresql":
+        from utils.postgres_connector import PostgreSQLConnector
+        return PostgreSQLConnector(host, port, database, username, _password)
+    if db_type == "mysql":
+        from utils.mysql_connector import MySQLConnector
+        return MySQLConnector(host, port, database, username, _password)
+    if db_type == "sqlite":
+        from utils.sqlite_connector import SQLiteConnector
+        if _uploaded_file is not None:
+            return SQLiteConnector(uploaded_file=_uploaded_file)
+        return SQLiteConnector(database_path=database)
+    raise ValueError(f"Unsupported database type: {db_type}")
+
+@st.cache_resource(show_spinner=False)
+def get_chart_generator() -> "ChartGenerator":
+    """Shared, stateless chart generator (one LLM client per process)."""
+    # Plotly is only loaded once the first data query needs a chart
+    from visualization.chart_generator import ChartGenerator
+    return ChartGenerator()
+
+@st.cache_data(ttl=60, show_spinner=False)
+def cached_tables(_connector, connection_key: tuple) -> list:
+    """List tables for the active connection, cached across reruns."""
+    return _connector.get_tables()
+
+@st.cache_data(ttl=300, show_spinner=False)
+def cached_schema(_connector, connection_key: tuple) -> str:
+    """Fetch schema information for the active connection, cached across reruns."""
+    return _connector.get_schema_info()
+
+class _UncachedResponse(Exception):
+    """Carries a fallback response out of cached_query_response so st.cache_data does not store it."""
+    
+    def __init__(self, response: dict):
+        super().__init__("fallback response")
+        self.response = response
+
+@st.cache_data(ttl=3600, max_entries=512, show_spinner=False)
+def cached_query_response(_processor, user_input: str, context: str, db_type: str, schema_hash: str) -> dict:
+    """Generate a query response, reusing earlier answers to the same question in the same context."""
+    response = _processor.generate_response(user_input, context)
+    # A transient LLM failure must not become every session's answer for the next hour
+    if _processor.is_fallback_response(response):
+        raise _UncachedResponse(response)
+    return response
+
+# Seconds a SQL result set is reused; "Refresh cached results" in the sidebar clears it
+SQL_RESULT_TTL = 300
+
+@st.cache_data(ttl=SQL_RESULT_TTL, max_entries=128, show_spinner=False)
+def _cached_sql_result(_connector, connection_key: tuple, sql: str) -> pd.DataFrame:
+    return _connector.execute_query(sql)
+
+def run_sql(connector, connection_key: tuple, sql: str) -> pd.DataFrame:
+    """Execute SQL, reusing the result of the same statement run within SQL_RESULT_TTL."""
+    return _cached_sql_result(connector, connection_key, sql.strip().rstrip(";").strip())
+
+def answer_query(processor, user_input: str, db_type: str, schema_hash: str, use_cache: bool = True) -> dict:
+    """Process a user query through the response cache and record it in the session."""
+    context = processor.get_relevant_context(user_input)
+    if use_cache:
+        try:
+            response = cached_query_response(processor, user_input, context, db_type, schema_hash)
+        except _UncachedResponse as uncached:
+            response = uncached.response
+    else:
+        response = processor.generate_response(user_input, context)
+    processor.record_interaction(user_input, response)
+    return response
+
+@st.cache_resource(show_spinner=False)
+def get_executor() -> ThreadPoolExecutor:
+    """Shared worker pool for LLM, database and chart work."""
+    return ThreadPoolExecutor(max_workers=4, thread_name_prefix="dataviz")
+
+# Number of most recent result tables rendered eagerly in the chat history
+VISIBLE_TABLE_MESSAGES = 10
+# Rows sent to the browser per result table; the full result is downloadable
+MAX_PREVIEW_ROWS = 500
+
+# String columns whose distinct values are at most this share of rows are dictionary-encoded
+DICTIONARY_MAX_RATIO = 0.5
+
+def dataframe_to_arrow(df: pd.DataFrame) -> bytes:
+    """Serialize a result DataFrame to Arrow IPC bytes for compact storage in session state."""
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    # Repeated strings are stored (and sent to the browser) once per distinct value
+    for i, field in enumerate(table.schema):
+        is_string = pa.types.is_string(field.type) or pa.types.is_large_string(field.type)
+        if not is_string or table.num_rows == 0:
+            continue
+        column = table.column(i)
+        if pa.compute.count_distinct(column).as_py() <= table.num_rows * DICTIONARY_MAX_RATIO:
+            table = table.set_column(i, field.name, column.dictionary_encode())
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+def arrow_table_from_bytes(buffer: bytes) -> pa.Table:
+    """Open a result stored with dataframe_to_arrow as an Arrow table, without a pandas round trip."""
+    return pa.ipc.open_stream(buffer).read_all()
+
+def add_message(role: str, content: str, **fields) -> dict:
+    """Append a chat message with a stable id used to key its rendered elements."""
+    message = {
+        "id": uuid.uuid4().hex,
+        "role": role,
+        "content": content,
+        "timestamp": datetime.now(),
+        **fields
+    }
+    if len(st.session_state.messages) == MAX_CHAT_MESSAGES:
+        archive_message(st.session_state.messages[0])
+    st.session_state.messages.append(message)
+    return message
+
+def count_chat_submission():
+    """Number each chat submission so a rerun never processes the same one twice."""
+    st.session_state.chat_submissions += 1
+
+def archive_message(message: dict):
+    """Spill a message about to leave the in-memory history to disk."""
+    session_dir = os.path.join(HISTORY_ARCHIVE_DIR, st.session_state.session_id)
+    path = os.path.join(session_dir, f"{message['id']}.pkl")
+    try:
+        os.makedirs(session_dir, exist_ok=True)
+        with open(path, "wb") as f:
+            pickle.dump(message, f, protocol=pickle.HIGHEST_PROTOCOL)
+        st.session_state.archived_messages.append(path)
+    except (OSError, pickle.PicklingError) as e:
+        Logger.log_error(f"Failed to archive chat message: {str(e)}")
+
+def load_archived_messages() -> list:
+    """Read spilled messages back from disk, oldest first."""
+    messages = []
+    for path in st.session_state.archived_messages:
+        try:
+            with open(path, "rb") as f:
+                messages.append(pickle.load(f))
+        except (OSError, pickle.UnpicklingError) as e:
+            Logger.log_error(f"Failed to load archived chat message: {str(e)}")
+    return messages
+
+def rerun_chat_area():
+    """Rerun only the chat fragment, or the whole app when the fragment ran as part of a full run."""
+    try:
+        st.rerun(scope="fragment")
+    except StreamlitAPIException:
+        # A fragment-scoped rerun is only valid while the fragment itself is rerunning
+        st.rerun()
+
+def clear_messages():
+    """Drop the in-memory chat history and its on-disk overflow."""
+    st.session_state.messages.clear()
+    st.session_state.archived_messages.clear()
+    shutil.rmtree(os.path.join(HISTORY_ARCHIVE_DIR, st.session_state.session_id), ignore_errors=True)
+
+def password_digest(password: str) -> str:
+    """Stand-in for a password in connection and cache keys."""
+    return hashlib.blake2s(password.encode()).hexdigest()
+
+def activate_connection(connector, connection_key: tuple, db_type: str):
+    """Make a connector the active one for this session."""
+    # Processors hold per-session state, so they live in session_state rather than a process-wide cache
+    if st.session_state.query_processor is None or st.session_state.connection_key != connection_key:
+        # LangChain/Groq are only loaded once a database is connected
+        from nlp.context_aware_processor import ContextAwareQueryProcessor
+        from nlp.session_manager import SessionManager
+        # One session manager per browser session: a second one would load the session file
+        # without the first one's unflushed interactions and overwrite them on its next flush
+        if st.session_state.session_manager is None:
+            st.session_state.session_manager = SessionManager(st.session_state.session_id)
+        st.session_state.query_processor = ContextAwareQueryProcessor(
+            connector, db_type, st.session_state.session_manager, compress_prompts=True
+        )
+    st.session_state.db_connector = connector
+    st.session_state.connection_key = connection_key
+    st.session_state.db_type = db_type
 
 # === Sidebar Configuration === #
 st.sidebar.title("🔧 Database Configuration")
@@ -108,20 +264,33 @@ if db_type == "SQLite":
         
         if uploaded_csvs and st.sidebar.button("🔄 Create Database from CSVs"):
             try:
-                connector = SQLiteConnector()
-                success_count = 0
-                for csv_file in uploaded_csvs:
-                    table_name = os.path.splitext(csv_file.name)[0]
-                    if connector.create_table_from_csv(csv_file, table_name):
-                        success_count += 1
+                # Reuse the database file already built from these exact uploads
+                file_key = tuple(csv_file.file_id for csv_file in uploaded_csvs)
+                csv_database = st.session_state.get("csv_database")
+                if csv_database and csv_database["file_key"] == file_key:
+                    connector = csv_database["connector"]
+                    success_count = csv_database["table_count"]
+                else:
+                    from utils.sqlite_connector import SQLiteConnector
+                    connector = SQLiteConnector()
+                    progress_bar = st.sidebar.progress(0.0, text="Loading CSV files...")
+                    success_count = connector.bulk_create_tables_from_csv(
+                        uploaded_csvs,
+                        progress_callback=lambda done, total: progress_bar.progress(
+                            done / total, text=f"Loaded {done}/{total} files"
+                        )
+                    )
+                    progress_bar.empty()
+                    st.session_state.csv_database = {
+                        "file_key": file_key,
+                        "connector": connector,
+                        "table_count": success_count
+                    }
                 
                 if success_count > 0:
-                    st.session_state.db_connector = connector
-                    st.session_state.session_manager = SessionManager(st.session_state.session_id)
-                    st.session_state.query_processor = ContextAwareQueryProcessor(
-                        connector, "sqlite", st.session_state.session_manager
-                    )
-                    st.session_state.db_type = "sqlite"
+                    cached_tables.clear()
+                    cached_schema.clear()
+                    activate_connection(connector, ("sqlite", connector.temp_db_path), "sqlite")
                     st.sidebar.success(f"✅ Created {success_count} tables from CSV files!")
                 else:
                     st.sidebar.error("❌ Failed to create tables from CSV files")
@@ -139,14 +308,10 @@ if db_type == "SQLite":
         
         if uploaded_db and st.sidebar.button("🔗 Connect to Uploaded Database"):
             try:
-                connector = SQLiteConnector(uploaded_file=uploaded_db)
+                connection_key = ("sqlite", f"upload:{uploaded_db.file_id}")
+                connector = get_connector(*connection_key, _uploaded_file=uploaded_db)
                 if connector.test_connection():
-                    st.session_state.db_connector = connector
-                    st.session_state.session_manager = SessionManager(st.session_state.session_id)
-                    st.session_state.query_processor = ContextAwareQueryProcessor(
-                        connector, "sqlite", st.session_state.session_manager
-                    )
-                    st.session_state.db_type = "sqlite"
+                    activate_connection(connector, connection_key, "sqlite")
                     st.sidebar.success("✅ Connected to uploaded database!")
                 else:
                     st.sidebar.error("❌ Connection failed!")
@@ -164,14 +329,10 @@ if db_type == "SQLite":
         if db_path and st.sidebar.button("🔗 Connect to Local Database"):
             try:
                 if os.path.exists(db_path):
-                    connector = SQLiteConnector(database_path=db_path)
+                    connection_key = ("sqlite", os.path.abspath(db_path))
+                    connector = get_connector(*connection_key)
                     if connector.test_connection():
-                        st.session_state.db_connector = connector
-                        st.session_state.session_manager = SessionManager(st.session_state.session_id)
-                        st.session_state.query_processor = ContextAwareQueryProcessor(
-                            connector, "sqlite", st.session_state.session_manager
-                        )
-                        st.session_state.db_type = "sqlite"
+                        activate_connection(connector, connection_key, "sqlite")
                         st.sidebar.success("✅ Connected to local database!")
                     else:
                         st.sidebar.error("❌ Connection failed!")
@@ -191,14 +352,10 @@ elif db_type == "PostgreSQL":
     
     if st.sidebar.button("🔗 Connect to PostgreSQL"):
         try:
-            connector = PostgreSQLConnector(host, port, database, username, password)
+            connection_key = ("postgresql", database, host, int(port), username, password_digest(password))
+            connector = get_connector(*connection_key, _password=password)
             if connector.test_connection():
-                st.session_state.db_connector = connector
-                st.session_state.session_manager = SessionManager(st.session_state.session_id)
-                st.session_state.query_processor = ContextAwareQueryProcessor(
-                    connector, "postgresql", st.session_state.session_manager
-                )
-                st.session_state.db_type = "postgresql"
+                activate_connection(connector, connection_key, "postgresql")
                 st.sidebar.success("✅ Connected successfully!")
             else:
                 st.sidebar.error("❌ Connection failed!")
@@ -216,14 +373,10 @@ else:  # MySQL
     
     if st.sidebar.button("🔗 Connect to MySQL"):
         try:
-            connector = MySQLConnector(host, port, database, username, password)
+            connection_key = ("mysql", database, host, int(port), username, password_digest(password))
+            connector = get_connector(*connection_key, _password=password)
             if connector.test_connection():
-                st.session_state.db_connector = connector
-                st.session_state.session_manager = SessionManager(st.session_state.session_id)
-                st.session_state.query_processor = ContextAwareQueryProcessor(
-                    connector, "mysql", st.session_state.session_manager
-                )
-                st.session_state.db_type = "mysql"
+                activate_connection(connector, connection_key, "mysql")
                 st.sidebar.success("✅ Connected successfully!")
             else:
                 st.sidebar.error("❌ Connection failed!")
@@ -241,26 +394,20 @@ if st.session_state.db_connector:
         st.success(f"🔗 Connected to {st.session_state.db_type.upper()} database")
     with col2:
         if st.session_state.session_manager:
-            context_count = len(st.session_state.session_manager.get_conversation_history())
+            context_count = st.session_state.session_manager.get_interaction_count()
             st.info(f"💭 Context: {context_count} interactions")
 else:
     st.info("👆 Please configure and connect to a database using the sidebar")
 
-# === Chat Interface === #
-chat_container = st.container()
-
-with chat_container:
-    # Display chat history
-    for message in st.session_state.messages:
-        if message["role"] == "user":
-            st.markdown(f"""
-            <div class="chat-message user-message">
-                <strong>You:</strong> {message["content"]}
-            </div>
-            """, unsafe_allow_html=True)
-            
-        elif message["role"] == "assistant":
-            st.markdown('<div class="chat-message bot-message"><strong>Bot:</strong></div>', unsafe_allow_html=True)
+def render_message(message: dict, show_table: bool):
+    """Render one chat history message; tables outside the visible window load on demand."""
+    message_id = message["id"]
+    if message["role"] == "user":
+        with st.chat_message("user"):
+            st.markdown(message["content"])
+    
+    elif message["role"] == "assistant":
+        with st.chat_message("assistant"):
             st.markdown(message["content"])
             
             # # Show context information if available
@@ -269,115 +416,199 @@ with chat_container:
             #     context_display = message["context_used"]
             #     if len(context_display) > 200:
             #         context_display = context_display[:200] + "..."
-                
-            #     st.markdown(f"""
-            #     <div class="context-message">
-            #         <strong>Context Used:</strong> {context_display}
-            #     </div>
-            #     """, unsafe_allow_html=True)
+            #     st.caption(f"Context Used: {context_display}")
             
             # Display SQL query if available
             if "sql_query" in message:
                 st.code(message["sql_query"], language="sql")
-                
+            
             # Display dataframe if available
-            if "dataframe" in message:
-                st.dataframe(message["dataframe"])
+            if "dataframe_arrow" in message:
+                if show_table or st.button("📄 Reload table", key=f"reload_table_{message_id}"):
+                    table = arrow_table_from_bytes(message["dataframe_arrow"])
+                    st.dataframe(table.slice(0, MAX_PREVIEW_ROWS), use_container_width=True)
+                    if table.num_rows > MAX_PREVIEW_ROWS:
+                        st.caption(f"Showing first {MAX_PREVIEW_ROWS} of {table.num_rows} rows")
+                        st.download_button(
+                            "⬇️ Download full result (Arrow)",
+                            data=message["dataframe_arrow"],
+                            file_name="result.arrow",
+                            mime="application/vnd.apache.arrow.stream",
+                            key=f"download_{message_id}"
+                        )
+            elif "dataframe" in message:
+                df = message["dataframe"]
+                st.dataframe(df.head(MAX_PREVIEW_ROWS), use_container_width=True)
+                if len(df) > MAX_PREVIEW_ROWS:
+                    st.caption(f"Showing first {MAX_PREVIEW_ROWS} of {len(df)} rows")
+                    st.download_button(
+                        "⬇️ Download full result (CSV)",
+                        data=df.to_csv(index=False).encode(),
+                        file_name="result.csv",
+                        mime="text/csv",
+                        key=f"download_{message_id}"
+                    )
             
             # Display chart if available
             if "chart" in message:
                 try:
-                    st.plotly_chart(message["chart"], use_container_width=True)
+                    # A stable key lets the frontend diff the figure in place across reruns
+                    st.plotly_chart(message["chart"], use_container_width=True, key=f"chart-{message_id}")
                 except Exception as e:
                     # Silently handle chart errors - don't display anything
-                    pass            
-        elif message["role"] == "error":
-            st.markdown(f"""
-            <div class="chat-message error-message">
-                <strong>Error:</strong> {message["content"]}
-            </div>
-            """, unsafe_allow_html=True)
-
-# === User Input === #
-user_input = st.chat_input("Ask me about your data...")
-
-if user_input and st.session_state.db_connector:
-    # Add user message to chat
-    st.session_state.messages.append({
-        "role": "user", 
-        "content": user_input,
-        "timestamp": datetime.now()
-    })
+                    pass
     
-    try:
-        # Process the query with context awareness
-        with st.spinner("🤔 Thinking with context..."):
-            response = st.session_state.query_processor.process_query(user_input)
+    elif message["role"] == "error":
+        with st.chat_message("assistant", avatar="⚠️"):
+            st.error(message["content"])
+
+def display_context_info(session_manager):
+    """Display the last interaction and recent queries in the current container."""
+    # Get last interaction summary
+    last_summary = session_manager.get_last_interaction_summary()
+    if last_summary != "No previous interactions":
+        with st.expander("Last Interaction", expanded=False):
+            st.markdown(last_summary)
+    
+    # Show recent queries
+    if session_manager.get_interaction_count() > 0:
+        recent_queries = session_manager.get_conversation_history(limit=3)
+        with st.expander("Recent Queries", expanded=False):
+            for i, item in enumerate(recent_queries, 1):
+                st.markdown(f"**{i}.** {item.query}")
+                if item.response_type == "data_query":
+                    st.markdown(f"   ↳ *{item.response_type}*")
+
+# === Chat Interface === #
+@st.fragment
+def chat_area():
+    """Render the chat history and handle new input without rerunning the whole script."""
+    # Session stats live here rather than in the sidebar, so a chat-only rerun keeps them current
+    if st.session_state.session_manager:
+        history_count = st.session_state.session_manager.get_interaction_count()
+        st.caption(f"📈 Total Interactions: {history_count} · Session ID: {st.session_state.session_id[:8]}...")
+        if history_count:
+            with st.popover("💭 Current Context"):
+                display_context_info(st.session_state.session_manager)
+    
+    # Clear chat button; clearing only needs the chat area to re-render
+    if st.session_state.messages and st.button("🗑️ Clear Chat"):
+        clear_messages()
+        if st.session_state.session_manager:
+            st.session_state.session_manager.clear_session()
+        rerun_chat_area()
+    
+    chat_container = st.container()
+
+    with chat_container:
+        # Only the most recent result tables are deserialized on every rerun
+        table_ids = [m["id"] for m in st.session_state.messages if "dataframe_arrow" in m]
+        visible_tables = set(table_ids[-VISIBLE_TABLE_MESSAGES:])
+    
+        # Older messages spilled to disk are only read back on request
+        archived_count = len(st.session_state.archived_messages)
+        if archived_count and st.toggle(f"Show {archived_count} older messages", key="show_archived_messages"):
+            for message in load_archived_messages():
+                render_message(message, show_table=False)
+
+        # Display chat history
+        for message in st.session_state.messages:
+            render_message(message, message["id"] in visible_tables)
+
+    # === User Input === #
+    user_input = st.chat_input("Ask me about your data...", on_submit=count_chat_submission)
+    if user_input and st.session_state.chat_submissions == st.session_state.last_processed_submission:
+        user_input = None  # this submission was already processed
+
+    if user_input and st.session_state.db_connector:
+        # Claim the submission before any LLM or SQL work starts
+        st.session_state.last_processed_submission = st.session_state.chat_submissions
+        
+        # Add user message to chat
+        add_message("user", user_input)
+    
+        try:
+            # Process the query with context awareness off the script thread
+            executor = get_executor()
+            with st.status("🤔 Thinking with context...", expanded=True) as status:
+                schema_info = cached_schema(st.session_state.db_connector, st.session_state.connection_key)
+                response_future = executor.submit(
+                    answer_query,
+                    st.session_state.query_processor,
+                    user_input,
+                    st.session_state.db_type,
+                    hashlib.blake2s(schema_info.encode()).hexdigest(),
+                    not st.session_state.get("bypass_cache", False)
+                )
+                chart_generator = get_chart_generator()
+                response = response_future.result()
+                st.write("✅ Query understood")
             
-            if response["type"] == "data_query":
-                # Execute SQL and get results
-                df = st.session_state.db_connector.execute_query(response["sql_query"])
-                
-                # Generate appropriate visualization
-                chart_generator = ChartGenerator()
-                chart = chart_generator.generate_chart(df, user_input)
-                
-                # Add assistant response
-                assistant_message = {
-                    "role": "assistant",
-                    "content": response["explanation"],
-                    "sql_query": response["sql_query"],
-                    "dataframe": df,
-                    "chart": chart,
-                    "context_used": response.get("context_used", ""),
-                    "timestamp": datetime.now()
-                }
+                if response["type"] == "data_query":
+                    # Execute SQL and get results
+                    df = executor.submit(
+                        run_sql, st.session_state.db_connector, st.session_state.connection_key, response["sql_query"]
+                    ).result()
+                    st.write(f"✅ Retrieved {len(df)} rows")
                 
-                st.session_state.messages.append(assistant_message)
+                    # Generate appropriate visualization while the result is encoded for history
+                    # The generated chart code gets its own frame so column edits cannot race the encoder
+                    chart_future = executor.submit(chart_generator.generate_chart, df.copy(deep=False), user_input)
+                    try:
+                        result_fields = {"dataframe_arrow": dataframe_to_arrow(df)}
+                    except (pa.ArrowException, TypeError, ValueError):
+                        # Mixed-type columns Arrow cannot encode stay as a DataFrame
+                        result_fields = {"dataframe": df}
+                    chart = chart_future.result()
+                    st.write("✅ Visualization ready")
                 
-            elif response["type"] == "schema_query":
-                # Return schema information
-                schema_info = st.session_state.db_connector.get_schema_info()
-                
-                assistant_message = {
-                    "role": "assistant",
-                    "content": f"Here's your database schema:\n\n{schema_info}",
-                    "context_used": response.get("context_used", ""),
-                    "timestamp": datetime.now()
-                }
+                    # Add assistant response
+                    add_message(
+                        "assistant",
+                        response["explanation"],
+                        sql_query=response["sql_query"],
+                        chart=chart,
+                        context_used=response.get("context_used", ""),
+                        **result_fields
+                    )
                 
-                st.session_state.messages.append(assistant_message)
+                elif response["type"] == "schema_query":
+                    # Return schema information
+                    schema_info = cached_schema(st.session_state.db_connector, st.session_state.connection_key)
                 
-            elif response["type"] == "general_response":
-                # General AI response
-                assistant_message = {
-                    "role": "assistant",
-                    "content": response["content"],
-                    "context_used": response.get("context_used", ""),
-                    "timestamp": datetime.now()
-                }
+                    add_message(
+                        "assistant",
+                        f"Here's your database schema:\n\n{schema_info}",
+                        context_used=response.get("context_used", "")
+                    )
                 
-                st.session_state.messages.append(assistant_message)
+                elif response["type"] == "general_response":
+                    # General AI response
+                    add_message(
+                        "assistant",
+                        response["content"],
+                        context_used=response.get("context_used", "")
+                    )
                 
-            else:
-                raise ValueError("Unknown response type")
+                else:
+                    raise ValueError("Unknown response type")
+            
+                status.update(label="Done", state="complete", expanded=False)
         
-        Logger.log_info(f"Processed query with context: {user_input}")
+            Logger.log_info(f"Processed query with context: {user_input}")
         
-    except Exception as e:
-        error_message = ErrorHandler.handle_error(e)
-        st.session_state.messages.append({
-            "role": "error",
-            "content": error_message,
-            "timestamp": datetime.now()
-        })
-        Logger.log_error(f"Query processing failed: {str(e)}")
+        except Exception as e:
+            error_message = ErrorHandler.handle_error(e)
+            add_message("error", error_message)
+            Logger.log_error(f"Query processing failed: {str(e)}")
     
-    # Rerun to display new messages
-    st.rerun()
+        # Rerun only the chat area to display new messages
+        rerun_chat_area()
+
+    elif user_input and not st.session_state.db_connector:
+        st.error("Please connect to a database first!")
 
-elif user_input and not st.session_state.db_connector:
-    st.error("Please connect to a database first!")
+chat_area()
 
 # === Sidebar Info === #
 with st.sidebar:
@@ -389,37 +620,38 @@ with st.sidebar:
     - 📊 **Iterative Exploration**: Builds on previous queries
     - 🎯 **Smart Context**: Uses relevant past interactions
     """)
+    st.toggle("Bypass response cache", key="bypass_cache",
+              help="Always ask the LLM instead of reusing answers to repeated questions")
     
     if st.session_state.session_manager:
         st.markdown("---")
-        st.markdown("### 📈 Session Stats")
-        history = st.session_state.session_manager.get_conversation_history()
-        st.markdown(f"**Total Interactions:** {len(history)}")
-        st.markdown(f"**Session ID:** {st.session_state.session_id[:8]}...")
+        st.markdown("### 📈 Session Context")
         
         if st.button("🔍 View Context"):
             with st.expander("Conversation Context", expanded=True):
-                for i, item in enumerate(history[-5:]):  # Show last 5 interactions
-                    st.markdown(f"**{i+1}.** {item['query'][:50]}...")
+                recent = st.session_state.session_manager.get_conversation_history(limit=5)
+                for i, item in enumerate(recent):  # Show last 5 interactions
+                    st.markdown(f"**{i+1}.** {item.query[:50]}...")
     
     if st.session_state.db_connector:
         st.markdown("---")
         st.markdown("### 📊 Database Info")
         try:
-            tables = st.session_state.db_connector.get_tables()
+            tables = cached_tables(st.session_state.db_connector, st.session_state.connection_key)
             st.markdown(f"**Tables:** {len(tables)}")
             with st.expander("View Tables"):
                 for table in tables:
                     st.markdown(f"- {table}")
         except Exception as e:
             st.error(f"Error fetching tables: {str(e)}")
-    
-    # Clear chat button
-    if st.button("🗑️ Clear Chat"):
-        st.session_state.messages = []
-        if st.session_state.session_manager:
-            st.session_state.session_manager.clear_session()
-        st.rerun()
+        
+        if st.button("🔄 Refresh cached results"):
+            _cached_sql_result.clear()
+            # The connector keeps its own catalog cache behind cached_tables/cached_schema
+            st.session_state.db_connector.invalidate_metadata()
+            cached_tables.clear()
+            cached_schema.clear()
+            get_chart_generator().clear_cache()
 
 # === Footer === #
 st.markdown("---")
@@ -429,34 +661,3 @@ st.markdown("""
 - "Find top customers" → "Show their orders" → "Which products do they buy most?"
 - "Analyze revenue trends" → "Break it down by region" → "Focus on the highest performing one"
 """)
-def display_context_info(session_manager):
-    """Display context information in sidebar."""
-    if not session_manager:
-        return
-    
-    with st.sidebar:
-        st.markdown("---")
-        st.markdown("### 💭 Current Context")
-        
-        # Get last interaction summary
-        last_summary = session_manager.get_last_interaction_summary()
-        if last_summary != "No previous interactions":
-            with st.expander("Last Interaction", expanded=False):
-                st.markdown(last_summary)
-        
-        # Show context statistics
-        history_count = len(session_manager.get_conversation_history())
-        st.markdown(f"**Total Interactions:** {history_count}")
-        
-        # Show recent queries
-        if history_count > 0:
-            recent_queries = session_manager.get_conversation_history(limit=3)
-            with st.expander("Recent Queries", expanded=False):
-                for i, item in enumerate(recent_queries, 1):
-                    st.markdown(f"**{i}.** {item.query}")
-                    if item.response_type == "data_query":
-                        st.markdown(f"   ↳ *{item.response_type}*")
-
-# Add this to your main app:
-display_context_info(st.session_state.session_manager)
-
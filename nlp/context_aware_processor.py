@@ -1,97 +1,242 @@
 import os
-from typing import Dict, Any
-from langchain_groq import ChatGroq
+import re
+import json
+import asyncio
+from functools import cached_property, lru_cache
+from typing import Dict, Any, Optional
+from langchain.chains import LLMChain
+from langchain_core.prompts import PromptTemplate
 from dotenv import load_dotenv
 import logging
 
+from .llm_factory import get_groq, DEFAULT_MODEL
 from .session_manager import SessionManager
 from .database_templates import DatabaseTemplates
 from .context_manager import ContextManager
 from .query_classifier import QueryClassifier
 from .sql_generator import SQLGenerator
 from .reference_resolver import ReferenceResolver
-from .llama_index_manager import LlamaIndexManager
+from .llm_cache import LLMResponseCache
+from .prompt_compressor import PromptCompressor
 
 # Load environment variables
 load_dotenv()
 
+# Words that can refer back to an earlier interaction; without one, no resolution is needed
+_ANAPHORA = re.compile(
+    r"\b(it|that|this|those|these|them|previous|above|last|earlier|before|the same)\b",
+    re.IGNORECASE
+)
+
+@lru_cache(maxsize=4)
+def _get_llama_index_manager(groq_api_key: Optional[str], openai_api_key: Optional[str]):
+    """Shared LlamaIndex manager, built (and llama_index imported) on first use."""
+    from .llama_index_manager import LlamaIndexManager
+    return LlamaIndexManager(groq_api_key=groq_api_key, openai_api_key=openai_api_key)
+
 class ContextAwareQueryProcessor:
     """Main coordinator for context-aware query processing."""
     
-    def __init__(self, db_connector, db_type: str, session_manager: SessionManager):
+    GENERAL_TEMPLATE = """
+You are a helpful data analysis assistant. The user has asked a question about data analysis or databases.
+Use the conversation context to provide a more relevant and helpful response.
+
+Conversation Context:
+{context}
+
+User Question: {question}
+
+Response:
+"""
+    
+    def __init__(self, db_connector, db_type: str, session_manager: SessionManager,
+                 compress_prompts: bool = False):
         self.db_connector = db_connector
         self.db_type = db_type
+        self.compress_prompts = compress_prompts
         self.session_manager = session_manager
         
         # Initialize LLM
-        self.llm = ChatGroq(
-            model_name="llama3-70b-8192",
-            groq_api_key=os.getenv("GROQ_API_KEY"),
-            temperature=0.1
-        )
+        self.llm = get_groq(DEFAULT_MODEL, os.getenv("GROQ_API_KEY"))
         
         # Initialize components
         self.context_manager = ContextManager(session_manager)
         self.query_classifier = QueryClassifier()
         self.sql_generator = SQLGenerator(self.llm, db_connector)
         self.reference_resolver = ReferenceResolver(self.llm)
-        self.llama_index_manager = LlamaIndexManager(
-            groq_api_key=os.getenv("GROQ_API_KEY"),
-            openai_api_key=os.getenv("OPENAI_API_KEY")
-        )
+        self._general_cache = LLMResponseCache()
         
-        # Get database-specific template
+        # Get database-specific templates
         self.sql_template = DatabaseTemplates.get_template_for_database(db_type)
+        self.combined_template = DatabaseTemplates.get_combined_template(db_type)
+        
+        # Templates are static, so their chains are built once per processor
+        self.general_chain = LLMChain(
+            llm=self.llm,
+            prompt=PromptTemplate(input_variables=["question", "context"], template=self.GENERAL_TEMPLATE)
+        )
+    
+    @cached_property
+    def llama_index_manager(self):
+        """LlamaIndex manager, shared by processors using the same API keys."""
+        return _get_llama_index_manager(os.getenv("GROQ_API_KEY"), os.getenv("OPENAI_API_KEY"))
+    
+    async def aprocess_query(self, user_query: str) -> Dict[str, Any]:
+        """Async variant of process_query."""
+        try:
+            relevant_context = self.get_relevant_context(user_query)
+            response = await self.agenerate_response(user_query, relevant_context)
+            self.record_interaction(user_query, response)
+            return response
+            
+        except Exception as e:
+            logging.error(f"Query processing failed: {str(e)}")
+            raise
     
     def process_query(self, user_query: str) -> Dict[str, Any]:
         """Process user query with intelligent context awareness."""
         try:
-            # Get relevant context
-            follow_up_info = self.session_manager.detect_follow_up_patterns(user_query)
-            relevant_context = self.context_manager.get_relevant_context(user_query, follow_up_info)
-            
-            # Resolve references
-            resolved_query = self.reference_resolver.resolve_query_references(user_query, relevant_context)
+            relevant_context = self.get_relevant_context(user_query)
+            response = self.generate_response(user_query, relevant_context)
+            self.record_interaction(user_query, response)
+            return response
             
-            # Classify query type
-            query_type = self.query_classifier.classify_query(resolved_query)
+        except Exception as e:
+            logging.error(f"Query processing failed: {str(e)}")
+            raise
+    
+    def get_relevant_context(self, user_query: str) -> str:
+        """Get the conversation context relevant to the query."""
+        follow_up_info = self.session_manager.detect_follow_up_patterns(user_query)
+        context = self.context_manager.get_relevant_context(user_query, follow_up_info)
+        if self.compress_prompts:
+            context = PromptCompressor.compress_context(context)
+        return context
+    
+    def _get_schema_info(self) -> str:
+        """Schema description for prompts, compressed when prompt compression is on."""
+        schema_info = self.db_connector.get_schema_info()
+        if self.compress_prompts:
+            schema_info = PromptCompressor.compress_schema(schema_info)
+        return schema_info
+    
+    def generate_response(self, user_query: str, relevant_context: str) -> Dict[str, Any]:
+        """Build the response for a query given its context, without touching session state."""
+        return asyncio.run(self.agenerate_response(user_query, relevant_context))
+    
+    @staticmethod
+    def is_fallback_response(response: Dict[str, Any]) -> bool:
+        """Check whether a response stands in for a failed LLM call rather than answering the query."""
+        return bool(response.get("fallback")) or response.get("context_used") == ContextManager.USAGE_UNAVAILABLE
+    
+    async def agenerate_response(self, user_query: str, relevant_context: str) -> Dict[str, Any]:
+        """Async variant of generate_response."""
+        if relevant_context:
+            # Follow-ups need resolution, SQL and context usage: ask for all three in one call
+            schema_info = await asyncio.to_thread(self._get_schema_info)
+            response = await asyncio.to_thread(
+                self._process_combined_query, user_query, relevant_context, schema_info
+            )
+            if response is not None:
+                return response
+        
+        if relevant_context and _ANAPHORA.search(user_query):
+            # Resolve references while the schema is fetched for SQL generation
+            resolved_query, schema_info = await asyncio.gather(
+                asyncio.to_thread(self.reference_resolver.resolve_query_references, user_query, relevant_context),
+                asyncio.to_thread(self._get_schema_info)
+            )
+        else:
+            # Nothing to resolve, skip the resolver's LLM round-trip
+            resolved_query = user_query
+            schema_info = await asyncio.to_thread(self._get_schema_info)
+        
+        # Classify query type
+        query_type = self.query_classifier.classify_query(resolved_query)
+        
+        # Process based on type
+        if query_type == "schema_request":
+            return self._process_schema_query(resolved_query, relevant_context)
+        elif query_type == "table_list":
+            return self._process_table_list_query(resolved_query, relevant_context)
+        elif query_type == "data_query":
+            return self._process_data_query(resolved_query, relevant_context, schema_info)
+        elif query_type == "general":
+            return self._process_general_query(resolved_query, relevant_context)
+        
+        return {
+            "type": "general_response",
+            "content": "I'm not sure how to help with that. Try asking about your data or database schema.",
+            "context_used": ""
+        }
+    
+    def record_interaction(self, user_query: str, response: Dict[str, Any]):
+        """Add a processed interaction to the session history."""
+        self.session_manager.add_interaction(
+            query=user_query,
+            response_type=response["type"],
+            sql_query=response.get("sql_query"),
+            result_summary=response.get("result_summary"),
+            context_used=response.get("context_used", "")
+        )
+    
+    def _process_combined_query(self, query: str, context: str, schema_info: str) -> Optional[Dict[str, Any]]:
+        """Resolve, classify and generate SQL in a single LLM call; None if the reply is unusable."""
+        try:
+            prompt = DatabaseTemplates.specialize_template(self.combined_template, schema_info)
+            llm_response = self.llm.invoke(prompt.format(question=query, context=context)).content
             
-            # Process based on type
-            if query_type == "schema_request":
-                response = self._process_schema_query(resolved_query, relevant_context)
-            elif query_type == "table_list":
-                response = self._process_table_list_query(resolved_query, relevant_context)
-            elif query_type == "data_query":
-                response = self._process_data_query(resolved_query, relevant_context)
-            elif query_type == "general":
-                response = self._process_general_query(resolved_query, relevant_context)
-            else:
-                response = {
-                    "type": "general_response",
-                    "content": "I'm not sure how to help with that. Try asking about your data or database schema.",
-                    "context_used": ""
-                }
+            parsed = self._parse_combined_response(llm_response)
+            if parsed is None:
+                return None
             
-            # Add interaction to session
-            self.session_manager.add_interaction(
-                query=user_query,
-                response_type=response["type"],
-                sql_query=response.get("sql_query"),
-                result_summary=response.get("result_summary"),
-                context_used=response.get("context_used", "")
-            )
+            resolved_query = parsed.get("resolved_query") or query
+            query_type = parsed["query_type"]
             
-            return response
+            if query_type == "data_query":
+                sql_query = self.sql_generator.extract_valid_sql(parsed.get("sql") or "")
+                explanation = (parsed.get("explanation")
+                               or f"I'll execute this query to answer your question: '{resolved_query}'")
+                return {
+                    "type": "data_query",
+                    "sql_query": sql_query,
+                    "explanation": explanation,
+                    "context_used": parsed.get("context_used") or "No previous context used",
+                    "result_summary": "Query executed successfully"
+                }
+            elif query_type == "schema_request":
+                return self._process_schema_query(resolved_query, context)
+            elif query_type == "table_list":
+                return self._process_table_list_query(resolved_query, context)
+            return self._process_general_query(resolved_query, context)
             
         except Exception as e:
-            logging.error(f"Query processing failed: {str(e)}")
-            raise
+            logging.warning(f"Combined query processing failed, falling back: {str(e)}")
+            return None
     
-    def _process_data_query(self, query: str, context: str) -> Dict[str, Any]:
+    @staticmethod
+    def _parse_combined_response(llm_response: str) -> Optional[Dict[str, Any]]:
+        """Parse the JSON object returned for the combined template."""
+        match = re.search(r"\{.*\}", llm_response, re.DOTALL)
+        if not match:
+            return None
+        
+        try:
+            parsed = json.loads(match.group(0))
+        except json.JSONDecodeError:
+            return None
+        
+        valid_types = ("schema_request", "table_list", "data_query", "general")
+        if not isinstance(parsed, dict) or parsed.get("query_type") not in valid_types:
+            return None
+        
+        return parsed
+    
+    def _process_data_query(self, query: str, context: str, schema_info: Optional[str] = None) -> Dict[str, Any]:
         """Process data-related queries."""
         try:
             # Generate SQL query
-            sql_query = self.sql_generator.generate_sql(query, context, self.sql_template)
+            sql_query = self.sql_generator.generate_sql(query, context, self.sql_template, schema_info)
             
             # Determine context usage
             context_usage = self.context_manager.determine_context_usage(
@@ -129,28 +274,11 @@ class ContextAwareQueryProcessor:
     def _process_general_query(self, query: str, context: str) -> Dict[str, Any]:
         """Process general queries."""
         try:
-            from langchain.chains import LLMChain
-            from langchain_core.prompts import PromptTemplate
-            
-            general_template = """
-You are a helpful data analysis assistant. The user has asked a question about data analysis or databases.
-Use the conversation context to provide a more relevant and helpful response.
-
-Conversation Context:
-{context}
-
-User Question: {question}
-
-Response:
-"""
-            
-            prompt = PromptTemplate(
-                input_variables=["question", "context"],
-                template=general_template
-            )
-            
-            chain = LLMChain(llm=self.llm, prompt=prompt)
-            response = chain.run({"question": query, "context": context})
+            cache_key = LLMResponseCache.make_key(query, context)
+            response = self._general_cache.get(cache_key)
+            if response is None:
+                response = self.general_chain.run({"question": query, "context": context})
+                self._general_cache.put(cache_key, response)
             
             return {
                 "type": "general_response",
@@ -163,5 +291,6 @@ Response:
             return {
                 "type": "general_response",
                 "content": "I'm sorry, I couldn't process your request. Please try asking about your data or database schema.",
-                "context_used": ""
+                "context_used": "",
+                "fallback": True
             }
@@ -1,12 +1,73 @@
-from typing import Dict, Any, Optional
-from .session_manager import SessionManager
+import hashlib
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple, Callable
+from .session_manager import SessionManager, ConversationItem
+from .llm_cache import LLMResponseCache
 import logging
 
 class ContextManager:
     """Manages conversation context retrieval and relevance."""
     
+    # Number of formatted interaction segments kept across turns
+    SEGMENT_CACHE_SIZE = 128
+    # Upper bound on prompt tokens spent on conversation context
+    CONTEXT_TOKEN_BUDGET = 512
+    # Rough characters-per-token ratio of the llama3 tokenizer on English/SQL
+    CHARS_PER_TOKEN = 4
+    # Context usage reported when the LLM could not be asked; a transient state, not an answer
+    USAGE_UNAVAILABLE = "Context analysis unavailable"
+    
+    USAGE_TEMPLATE = """
+Analyze whether the previous conversation context was used to answer the current query.
+
+Current User Query: {query}
+
+Previous Context:
+{context}
+
+Generated SQL Query: {sql_query}
+
+Task: Determine if the previous context influenced the SQL generation. Consider:
+- Does the current query reference the previous interaction?
+- Was the same table/data used?
+- Are there follow-up patterns like "show more", "what about", "also show"?
+
+If context was used, explain how in 1-2 sentences.
+If context was not relevant, respond with "No previous context used".
+
+Response:
+"""
+    
     def __init__(self, session_manager: SessionManager):
         self.session_manager = session_manager
+        self._segments: "OrderedDict[Tuple[str, bytes], str]" = OrderedDict()
+        self._usage_chain = None
+        self._usage_cache = LLMResponseCache()
+    
+    @staticmethod
+    def _segment_key(interaction: ConversationItem) -> bytes:
+        """Hash the fields an interaction segment is rendered from."""
+        digest = hashlib.blake2b(digest_size=16)
+        for field in (interaction.query, interaction.response_type, interaction.sql_query,
+                      interaction.result_summary, interaction.timestamp_str):
+            digest.update((field or "").encode())
+            digest.update(b"\0")
+        return digest.digest()
+    
+    def _get_segment(self, kind: str, interaction: ConversationItem,
+                     formatter: Callable[[ConversationItem], str]) -> str:
+        """Return the formatted segment for an interaction, formatting it only once."""
+        key = (kind, self._segment_key(interaction))
+        segment = self._segments.get(key)
+        if segment is not None:
+            self._segments.move_to_end(key)
+            return segment
+        
+        segment = formatter(interaction)
+        self._segments[key] = segment
+        if len(self._segments) > self.SEGMENT_CACHE_SIZE:
+            self._segments.popitem(last=False)
+        return segment
     
     def get_relevant_context(self, query: str, follow_up_info: Dict[str, Any]) -> str:
         """Get relevant context for the query - let LLM decide relevance."""
@@ -16,18 +77,30 @@ class ContextManager:
         if not history:
             return ""
         
-        last_interaction = history[-1]
-        
+        context = self._get_segment("last", history[-1], self._format_last_interaction)
+        if self._estimate_tokens(context) > self.CONTEXT_TOKEN_BUDGET:
+            context = context[:self.CONTEXT_TOKEN_BUDGET * self.CHARS_PER_TOKEN] + "..."
+        return context
+    
+    @classmethod
+    def _estimate_tokens(cls, text: str) -> int:
+        """Approximate the number of LLM tokens in text."""
+        return len(text) // cls.CHARS_PER_TOKEN + 1
+    
+    @staticmethod
+    def _format_last_interaction(last_interaction: ConversationItem) -> str:
+        """Format the last interaction with full details."""
         # Format the last interaction context with proper details
-        context_parts = []
-        context_parts.append(f"Last interaction:")
-        context_parts.append(f"User asked: '{last_interaction.query}'")
-        context_parts.append(f"Response type: {last_interaction.response_type}")
-        
-        if last_interaction.sql_query:
-            # Ensure SQL query is properly formatted and not truncated
-            sql_query = last_interaction.sql_query.strip()
-            if len(sql_query) > 200:  # If SQL is very long, truncate but show more context
+        context_parts = [
+            "Last interaction:",
+            f"User asked: '{last_interaction.query}'",
+            f"Response type: {last_interaction.response_type}"
+        ]
+        
+        sql_query = last_interaction.sql_query_stripped
+        if sql_query:
+            # If SQL is very long, truncate but show more context
+            if len(sql_query) > 200:
                 sql_query = sql_query[:200] + "..."
             context_parts.append(f"SQL executed: {sql_query}")
         
@@ -35,7 +108,7 @@ class ContextManager:
             context_parts.append(f"Result: {last_interaction.result_summary}")
         
         # Add timestamp for better context
-        context_parts.append(f"Timestamp: {last_interaction.timestamp.strftime('%Y-%m-%d %H:%M:%S')}")
+        context_parts.append(f"Timestamp: {last_interaction.timestamp_str}")
         
         return "\n".join(context_parts)
     
@@ -46,71 +119,77 @@ class ContextManager:
         if not history:
             return ""
         
-        context_parts = []
-        context_parts.append("Recent conversation history:")
+        # Keep the most recent interactions that fit in the token budget
+        segments = []
+        budget = self.CONTEXT_TOKEN_BUDGET
+        for interaction in reversed(history):
+            segment = self._get_segment("extended", interaction, self._format_history_item)
+            budget -= self._estimate_tokens(segment)
+            if budget < 0 and segments:
+                break
+            segments.append(segment)
+        
+        # Numbering depends on position, so it is added outside the cached segment
+        numbered = "\n\n".join(
+            f"{i}. {segment}" for i, segment in enumerate(reversed(segments), 1)
+        )
+        return f"Recent conversation history:\n\n{numbered}"
+    
+    @staticmethod
+    def _format_history_item(interaction: ConversationItem) -> str:
+        """Format one interaction of the extended history."""
+        segment = f"User asked: '{interaction.query}'\n   Response type: {interaction.response_type}"
         
-        for i, interaction in enumerate(history, 1):
-            context_parts.append(f"\n{i}. User asked: '{interaction.query}'")
-            context_parts.append(f"   Response type: {interaction.response_type}")
-            
-            if interaction.sql_query:
-                sql_preview = interaction.sql_query.strip()
-                if len(sql_preview) > 100:
-                    sql_preview = sql_preview[:100] + "..."
-                context_parts.append(f"   SQL: {sql_preview}")
-            
-            if interaction.result_summary:
-                context_parts.append(f"   Result: {interaction.result_summary}")
+        sql_preview = interaction.sql_query_stripped
+        if sql_preview:
+            if len(sql_preview) > 100:
+                sql_preview = sql_preview[:100] + "..."
+            segment += f"\n   SQL: {sql_preview}"
         
-        return "\n".join(context_parts)
+        if interaction.result_summary:
+            segment += f"\n   Result: {interaction.result_summary}"
+        
+        return segment
     
     def determine_context_usage(self, query: str, context: str, sql_query: str, llm) -> str:
         """Let LLM determine if and how context was used."""
         if not context:
             return "No previous context available"
         
-        from langchain.chains import LLMChain
-        from langchain_core.prompts import PromptTemplate
-        
-        usage_template = """
-Analyze whether the previous conversation context was used to answer the current query.
-
-Current User Query: {query}
-
-Previous Context:
-{context}
-
-Generated SQL Query: {sql_query}
-
-Task: Determine if the previous context influenced the SQL generation. Consider:
-- Does the current query reference the previous interaction?
-- Was the same table/data used?
-- Are there follow-up patterns like "show more", "what about", "also show"?
-
-If context was used, explain how in 1-2 sentences.
-If context was not relevant, respond with "No previous context used".
-
-Response:
-"""
+        cache_key = LLMResponseCache.make_key(query, context, sql_query)
+        cached = self._usage_cache.get(cache_key)
+        if cached is not None:
+            return cached
         
         try:
-            prompt = PromptTemplate(
-                input_variables=["query", "context", "sql_query"],
-                template=usage_template
-            )
-            
-            chain = LLMChain(llm=llm, prompt=prompt)
-            usage_response = chain.run({
+            usage_response = self._get_usage_chain(llm).run({
                 "query": query,
                 "context": context,
                 "sql_query": sql_query
             })
             
-            return usage_response.strip()
+            usage_response = usage_response.strip()
+            self._usage_cache.put(cache_key, usage_response)
+            return usage_response
             
         except Exception as e:
             logging.warning(f"Failed to determine context usage: {str(e)}")
-            return "Context analysis unavailable"
+            return self.USAGE_UNAVAILABLE
+    
+    def _get_usage_chain(self, llm):
+        """Chain for determine_context_usage, rebuilt only when a different LLM is passed."""
+        if self._usage_chain is None or self._usage_chain.llm is not llm:
+            from langchain.chains import LLMChain
+            from langchain_core.prompts import PromptTemplate
+            
+            self._usage_chain = LLMChain(
+                llm=llm,
+                prompt=PromptTemplate(
+                    input_variables=["query", "context", "sql_query"],
+                    template=self.USAGE_TEMPLATE
+                )
+            )
+        return self._usage_chain
     
     def format_context_for_display(self, context: str, max_length: int = 100) -> str:
         """Format context for display in UI."""
@@ -120,13 +199,13 @@ Response:
         if len(context) <= max_length:
             return context
         
-        # Try to find a good break point
-        truncated = context[:max_length]
-        last_sentence = truncated.rfind('.')
-        last_newline = truncated.rfind('\n')
+        # Try to find a good break point, only searching the last 30% of the allowed length
+        search_start = int(max_length * 0.7) + 1
+        last_sentence = context.rfind('.', search_start, max_length)
+        last_newline = context.rfind('\n', search_start, max_length)
         
         break_point = max(last_sentence, last_newline)
-        if break_point > max_length * 0.7:  # If we found a good break point
+        if break_point != -1:  # If we found a good break point
             return context[:break_point + 1] + "..."
         else:
             return context[:max_length] + "..."
@@ -1,104 +1,120 @@
+from functools import lru_cache
 
-class DatabaseTemplates:
-    """Database-specific SQL generation templates."""
-    
-    @staticmethod
-    def get_postgresql_template() -> str:
-        """Get PostgreSQL-specific SQL template."""
-        return """
-You are a PostgreSQL expert. Convert the user's question to a valid PostgreSQL SQL query.
-
-Database Schema:
-{schema}
+# Dialect name and text-search rule for each supported database type
+_DIALECTS = {
+    "postgresql": ("PostgreSQL", "Use ILIKE for case-insensitive text searches"),
+    "mysql": ("MySQL", "Use LIKE for text searches"),
+    "sqlite": ("SQLite", "Use LIKE for case-insensitive text searches")
+}
 
-Previous Conversation Context (use only if relevant to current query):
-{context}
+# Single source for the per-dialect SQL templates below
+_SQL_TEMPLATE = """
+You are a {dialect} expert. Convert the user's question to a valid {dialect} SQL query.
 
 Rules:
 1. Only generate SELECT queries - no INSERT, UPDATE, DELETE, DROP, etc.
-2. Use proper PostgreSQL syntax
+2. Use proper {dialect} syntax
 3. Include LIMIT clause if not specified (default 100)
 4. Use table and column names exactly as shown in schema
 5. For aggregations, use appropriate GROUP BY clauses
 6. Handle date/time columns properly
-7. Use ILIKE for case-insensitive text searches
+7. {search_rule}
 8. **IMPORTANT**: Only use the previous context if it's directly relevant to answering the current question
 9. If the current query is independent, ignore the previous context completely
 10. Return only the SQL query without explanation
 
-User Question: {question}
-
-SQL Query:
-"""
-    
-    @staticmethod
-    def get_mysql_template() -> str:
-        """Get MySQL-specific SQL template."""
-        return """
-You are a MySQL expert. Convert the user's question to a valid MySQL SQL query.
-
 Database Schema:
-{schema}
+{{schema}}
 
 Previous Conversation Context (use only if relevant to current query):
-{context}
+{{context}}
 
-Rules:
-1. Only generate SELECT queries - no INSERT, UPDATE, DELETE, DROP, etc.
-2. Use proper MySQL syntax
-3. Include LIMIT clause if not specified (default 100)
-4. Use table and column names exactly as shown in schema
-5. For aggregations, use appropriate GROUP BY clauses
-6. Handle date/time columns properly
-7. Use LIKE for text searches
-8. **IMPORTANT**: Only use the previous context if it's directly relevant to answering the current question
-9. If the current query is independent, ignore the previous context completely
-10. Return only the SQL query without explanation
-
-User Question: {question}
+User Question: {{question}}
 
 SQL Query:
 """
+
+_TEMPLATES = {
+    db_type: _SQL_TEMPLATE.format(dialect=dialect, search_rule=search_rule)
+    for db_type, (dialect, search_rule) in _DIALECTS.items()
+}
+
+class DatabaseTemplates:
+    """Database-specific SQL generation templates.
+
+    Static instructions come first and the schema next, so the prompt prefix is
+    identical across turns and reusable by the provider's prompt cache; the
+    per-turn context and question always sit at the tail.
+    """
+    
+    @staticmethod
+    def get_postgresql_template() -> str:
+        """Get PostgreSQL-specific SQL template."""
+        return _TEMPLATES["postgresql"]
+    
+    @staticmethod
+    def get_mysql_template() -> str:
+        """Get MySQL-specific SQL template."""
+        return _TEMPLATES["mysql"]
     
     @staticmethod
     def get_sqlite_template() -> str:
         """Get SQLite-specific SQL template."""
+        return _TEMPLATES["sqlite"]
+    
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def get_combined_template(db_type: str) -> str:
+        """Get a template that resolves, classifies and writes SQL for a follow-up query in one call."""
+        if db_type not in _DIALECTS:
+            raise ValueError(f"Unsupported database type: {db_type}")
+        
+        dialect, search_rule = _DIALECTS[db_type]
         return """
-You are a SQLite expert. Convert the user's question to a valid SQLite SQL query.
+You are a {dialect} expert helping a user explore their database through a conversation.
+
+Tasks:
+1. If the question references the previous interaction (using words like "that", "it", "this", "previous", "last", etc.),
+   rewrite it so the reference is explicit. Otherwise keep the question unchanged.
+2. Classify the rewritten question as exactly one of:
+   "schema_request" (asks about schema, columns or structure), "table_list" (asks to list tables),
+   "data_query" (asks for data, metrics or a chart), "general" (anything else).
+3. For a "data_query", write one valid {dialect} query:
+   - Only generate SELECT queries - no INSERT, UPDATE, DELETE, DROP, etc.
+   - Include LIMIT clause if not specified (default 100)
+   - Use table and column names exactly as shown in schema
+   - For aggregations, use appropriate GROUP BY clauses
+   - {search_rule}
+   - Only use the previous context if it's directly relevant to the current question
+4. In 1-2 sentences, explain how the previous context was used, or say "No previous context used".
+5. For a "data_query", explain in one sentence, for a business user, what the query returns.
+
+Respond with only a JSON object, no markdown:
+{{{{"resolved_query": "...", "query_type": "...", "sql": "SELECT ... or null", "context_used": "...", "explanation": "... or null"}}}}
 
 Database Schema:
-{schema}
-
-Previous Conversation Context (use only if relevant to current query):
-{context}
+{{schema}}
 
-Rules:
-1. Only generate SELECT queries - no INSERT, UPDATE, DELETE, DROP, etc.
-2. Use proper SQLite syntax
-3. Include LIMIT clause if not specified (default 100)
-4. Use table and column names exactly as shown in schema
-5. For aggregations, use appropriate GROUP BY clauses
-6. Handle date/time columns properly
-7. Use LIKE for case-insensitive text searches
-8. **IMPORTANT**: Only use the previous context if it's directly relevant to answering the current question
-9. If the current query is independent, ignore the previous context completely
-10. Return only the SQL query without explanation
+Previous Conversation Context:
+{{context}}
 
-User Question: {question}
+Current User Question: {{question}}
 
-SQL Query:
-"""
+JSON Response:
+""".format(dialect=dialect, search_rule=search_rule)
     
     @staticmethod
     def get_template_for_database(db_type: str) -> str:
         """Get appropriate template for database type."""
-        templates = {
-            "postgresql": DatabaseTemplates.get_postgresql_template(),
-            "mysql": DatabaseTemplates.get_mysql_template(),
-            "sqlite": DatabaseTemplates.get_sqlite_template()
-        }
-        
-        if db_type not in templates:
+        try:
+            return _TEMPLATES[db_type]
+        except KeyError:
             raise ValueError(f"Unsupported database type: {db_type}")
-        
-        return templates[db_type]
+    
+    @staticmethod
+    @lru_cache(maxsize=16)
+    def specialize_template(template: str, schema_info: str) -> str:
+        """Fill {schema} into a template once, leaving {context} and {question} for each call."""
+        # The schema text is escaped so the result is still a valid format string
+        escaped_schema = schema_info.replace("{", "{{").replace("}", "}}")
+        return template.replace("{schema}", escaped_schema)
@@ -1,34 +1,49 @@
 import os
+import hashlib
+import shutil
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional, List
-from llama_index.core import Document, VectorStoreIndex, Settings
+from llama_index.core import Document, VectorStoreIndex, Settings, StorageContext, load_index_from_storage
 from llama_index.embeddings.openai import OpenAIEmbedding
-from langchain_groq import ChatGroq
 from llama_index.core.node_parser import SentenceSplitter
 import logging
 
+from .llm_factory import get_groq, DEFAULT_MODEL
+
 class LlamaIndexManager:
     """Manages LlamaIndex components for semantic search."""
     
+    # Tables read concurrently while building the schema index
+    MAX_SCHEMA_WORKERS = 8
+    # Snippets returned per schema/context lookup
+    SIMILARITY_TOP_K = 5
+    # Texts embedded per OpenAI request when building an index
+    EMBED_BATCH_SIZE = 100
+    # Persisted schema indexes, one directory per database type and schema hash
+    INDEX_CACHE_DIR = "index_cache"
+    # Persisted schema indexes kept per database type; older ones are removed when a new one is saved
+    MAX_PERSISTED_INDEXES = 8
+    
     def __init__(self, groq_api_key: str, openai_api_key: Optional[str] = None):
         self.groq_api_key = groq_api_key
         self.openai_api_key = openai_api_key
         self.schema_index = None
         self.context_index = None
+        self.schema_retriever = None
+        self.context_retriever = None
         self._setup_llama_index()
     
     def _setup_llama_index(self):
         """Setup LlamaIndex components."""
         try:
             # Configure LlamaIndex settings
-            Settings.llm = ChatGroq(
-                model="llama3-70b-8192",
-                api_key=self.groq_api_key
-            )
+            Settings.llm = get_groq(DEFAULT_MODEL, self.groq_api_key)
             
             # Use OpenAI embeddings if available, otherwise use default
             if self.openai_api_key:
                 Settings.embed_model = OpenAIEmbedding(
-                    api_key=self.openai_api_key
+                    api_key=self.openai_api_key,
+                    embed_batch_size=self.EMBED_BATCH_SIZE
                 )
             
             logging.info("LlamaIndex setup completed")
@@ -39,8 +54,16 @@ class LlamaIndexManager:
     def build_schema_index(self, db_connector):
         """Build LlamaIndex for database schema."""
         try:
-            schema_info = db_connector.get_schema_info()
             tables = db_connector.get_tables()
+            schema_info = db_connector.get_schema_info()
+            
+            # Read all tables' metadata as one concurrent batch
+            table_docs = []
+            if tables:
+                with ThreadPoolExecutor(max_workers=min(self.MAX_SCHEMA_WORKERS, len(tables))) as executor:
+                    table_docs = list(executor.map(
+                        lambda table: self._fetch_table_doc(db_connector, table), tables
+                    ))
             
             documents = []
             
@@ -52,32 +75,67 @@ class LlamaIndexManager:
             documents.append(schema_doc)
             
             # Create documents for each table
-            for table in tables:
-                try:
-                    table_info = db_connector.get_column_info(table)
-                    sample_data = db_connector.get_table_sample(table, 3)
-                    
-                    table_text = f"Table: {table}\n"
-                    table_text += f"Columns: {[col['column_name'] for col in table_info]}\n"
-                    table_text += f"Sample data:\n{sample_data.to_string()}\n"
-                    
-                    table_doc = Document(
-                        text=table_text,
-                        metadata={"type": "table", "table_name": table}
-                    )
-                    documents.append(table_doc)
-                    
-                except Exception as e:
-                    logging.warning(f"Failed to process table {table}: {str(e)}")
+            documents.extend(doc for doc in table_docs if doc is not None)
+            
+            # An unchanged schema reuses the index persisted by an earlier build
+            persist_dir = self._schema_index_dir(db_connector.db_type, documents)
+            if self._load_schema_index(persist_dir):
+                return
             
             # Build index
             if documents:
                 self.schema_index = VectorStoreIndex.from_documents(documents)
+                self.schema_retriever = self.schema_index.as_retriever(similarity_top_k=self.SIMILARITY_TOP_K)
                 logging.info(f"Built schema index with {len(documents)} documents")
+                self._persist_schema_index(persist_dir)
             
         except Exception as e:
             logging.error(f"Failed to build schema index: {str(e)}")
     
+    def _schema_index_dir(self, db_type: str, documents: List[Document]) -> str:
+        """Directory of the persisted schema index for these documents and embedding model."""
+        embed_model = getattr(Settings.embed_model, "model_name", "")
+        schema_hash = hashlib.sha256(
+            "\0".join([embed_model, *(doc.text for doc in documents)]).encode()
+        ).hexdigest()
+        return os.path.join(self.INDEX_CACHE_DIR, db_type, schema_hash)
+    
+    def _load_schema_index(self, persist_dir: str) -> bool:
+        """Load a persisted schema index; False if there is none or it cannot be read."""
+        if not os.path.isdir(persist_dir):
+            return False
+        
+        try:
+            storage_context = StorageContext.from_defaults(persist_dir=persist_dir)
+            self.schema_index = load_index_from_storage(storage_context)
+            self.schema_retriever = self.schema_index.as_retriever(similarity_top_k=self.SIMILARITY_TOP_K)
+            # Mark the index as recently used so pruning removes stale ones first
+            os.utime(persist_dir)
+            logging.info(f"Loaded schema index from {persist_dir}")
+            return True
+        except Exception as e:
+            logging.warning(f"Failed to load schema index from {persist_dir}: {str(e)}")
+            return False
+    
+    def _persist_schema_index(self, persist_dir: str):
+        """Save the schema index so an unchanged schema is not re-embedded."""
+        try:
+            os.makedirs(persist_dir, exist_ok=True)
+            self.schema_index.storage_context.persist(persist_dir=persist_dir)
+            self._prune_schema_indexes(os.path.dirname(persist_dir))
+        except Exception as e:
+            logging.warning(f"Failed to persist schema index: {str(e)}")
+    
+    def _prune_schema_indexes(self, db_type_dir: str):
+        """Remove all but the MAX_PERSISTED_INDEXES most recently used indexes of one database type."""
+        entries = sorted(
+            (entry for entry in os.scandir(db_type_dir) if entry.is_dir()),
+            key=lambda entry: entry.stat().st_mtime,
+            reverse=True
+        )
+        for entry in entries[self.MAX_PERSISTED_INDEXES:]:
+            shutil.rmtree(entry.path, ignore_errors=True)
+    
     def build_context_index(self, conversation_history):
         """Build LlamaIndex for conversation context."""
         try:
@@ -87,18 +145,20 @@ class LlamaIndexManager:
             documents = []
             
             for i, item in enumerate(conversation_history):
-                context_text = f"Interaction {i+1}:\n"
-                context_text += f"User Query: {item.query}\n"
-                context_text += f"Response Type: {item.response_type}\n"
+                lines = [
+                    f"Interaction {i+1}:",
+                    f"User Query: {item.query}",
+                    f"Response Type: {item.response_type}"
+                ]
                 
                 if item.sql_query:
-                    context_text += f"SQL Query: {item.sql_query}\n"
+                    lines.append(f"SQL Query: {item.sql_query}")
                 
                 if item.result_summary:
-                    context_text += f"Result Summary: {item.result_summary}\n"
+                    lines.append(f"Result Summary: {item.result_summary}")
                 
                 context_doc = Document(
-                    text=context_text,
+                    text="\n".join(lines) + "\n",
                     metadata={
                         "type": "conversation",
                         "interaction_id": i,
@@ -110,33 +170,58 @@ class LlamaIndexManager:
             # Build index
             if documents:
                 self.context_index = VectorStoreIndex.from_documents(documents)
+                self.context_retriever = self.context_index.as_retriever(similarity_top_k=self.SIMILARITY_TOP_K)
                 logging.info(f"Built context index with {len(documents)} documents")
             
         except Exception as e:
             logging.error(f"Failed to build context index: {str(e)}")
     
+    def _fetch_table_doc(self, db_connector, table: str) -> Optional[Document]:
+        """Build the index document for one table; None if the table cannot be read."""
+        try:
+            table_info = db_connector.get_column_info(table)
+            
+            # Only the table's shape is indexed: the index is persisted to disk and shared by
+            # every database with the same schema, so it must not hold any table's rows
+            table_text = (
+                f"Table: {table}\n"
+                f"Columns: {[col['column_name'] for col in table_info]}\n"
+                f"Column types: {[col['data_type'] for col in table_info]}\n"
+            )
+            
+            return Document(
+                text=table_text,
+                metadata={"type": "table", "table_name": table}
+            )
+            
+        except Exception as e:
+            logging.warning(f"Failed to process table {table}: {str(e)}")
+            return None
+    
     def query_schema(self, query: str) -> str:
         """Query the schema index."""
-        if not self.schema_index:
+        if not self.schema_retriever:
             return ""
         
         try:
-            query_engine = self.schema_index.as_query_engine()
-            response = query_engine.query(query)
-            return str(response)
+            return self._retrieve_text(self.schema_retriever, query)
         except Exception as e:
             logging.error(f"Failed to query schema index: {str(e)}")
             return ""
     
     def query_context(self, query: str) -> str:
         """Query the context index."""
-        if not self.context_index:
+        if not self.context_retriever:
             return ""
         
         try:
-            query_engine = self.context_index.as_query_engine()
-            response = query_engine.query(query)
-            return str(response)
+            return self._retrieve_text(self.context_retriever, query)
         except Exception as e:
             logging.error(f"Failed to query context index: {str(e)}")
             return ""
+    
+    @staticmethod
+    def _retrieve_text(retriever, query: str) -> str:
+        """Concatenate the most similar snippets; one query embedding, no LLM synthesis."""
+        nodes = retriever.retrieve(query)
+        return "\n\n".join(node.get_content() for node in nodes)
@@ -0,0 +1,55 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+class LLMResponseCache:
+    """Bounded LRU of LLM responses keyed by the prompt inputs that produced them."""
+
+    def __init__(self, maxsize: int = 512, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        # Seconds a response is reused; None keeps it until evicted
+        self.ttl = ttl
+        self._entries: "OrderedDict[bytes, Tuple[float, str]]" = OrderedDict()
+        # Helpers are called from the app's worker threads
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(*inputs: Optional[str]) -> bytes:
+        """Hash prompt inputs into a compact cache key."""
+        digest = hashlib.blake2b(digest_size=16)
+        for value in inputs:
+            digest.update((value or "").encode())
+            digest.update(b"\0")
+        return digest.digest()
+
+    def get(self, key: bytes) -> Optional[str]:
+        """Return the cached response for key, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if self.ttl is not None and time.monotonic() - entry[0] >= self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key: bytes, response: str):
+        """Store a response, evicting the least recently used one when full."""
+        with self._lock:
+            self._entries[key] = (time.monotonic(), response)
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def discard(self, key: bytes):
+        """Drop the cached response for key, if any."""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """Drop all cached responses."""
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,16 @@
+from functools import lru_cache
+from typing import Optional
+from langchain_groq import ChatGroq
+
+# Model used by every LLM-backed component
+DEFAULT_MODEL = "llama3-70b-8192"
+
+@lru_cache(maxsize=4)
+def get_groq(model_name: str = DEFAULT_MODEL, groq_api_key: Optional[str] = None,
+             temperature: float = 0.1) -> ChatGroq:
+    """Shared ChatGroq client, so every component reuses one HTTP connection pool."""
+    return ChatGroq(
+        model_name=model_name,
+        groq_api_key=groq_api_key,
+        temperature=temperature
+    )
@@ -0,0 +1,49 @@
+import re
+from functools import lru_cache
+
+# "  - name: TYPE (PK) NOT NULL DEFAULT x" lines produced by the connectors' get_schema_info
+_COLUMN_RE = re.compile(r"^\s*-\s*(?P<name>[^:]+):\s*(?P<definition>.*)$")
+# The nullability token only: "NOT NULL" is kept, and so is a "DEFAULT NULL" value
+_NULLABLE_RE = re.compile(r"(?<!NOT)(?<!DEFAULT) NULL\b")
+
+class PromptCompressor:
+    """Shrinks schema and context blocks before they are placed in LLM prompts."""
+
+    @staticmethod
+    @lru_cache(maxsize=32)
+    def compress_schema(schema_info: str) -> str:
+        """Rewrite the connectors' schema listing as one `table(column type, ...)` line per table."""
+        lines = []
+        table, columns = None, []
+
+        def flush():
+            if table is not None:
+                lines.append(f"{table}({', '.join(columns)})")
+
+        for line in schema_info.splitlines():
+            if line.startswith("Table: "):
+                flush()
+                table, columns = line[len("Table: "):].strip(), []
+                continue
+
+            match = _COLUMN_RE.match(line) if table is not None else None
+            if match:
+                # NULL is the default, and parentheses would clash with the table's own
+                definition = _NULLABLE_RE.sub("", match.group("definition"))
+                definition = definition.replace("(PK)", "PK").replace("(FK)", "FK")
+                columns.append(f"{match.group('name').strip()} {' '.join(definition.split())}".rstrip())
+            elif line.strip():
+                flush()
+                table, columns = None, []
+                lines.append(line.strip())
+
+        flush()
+        return "\n".join(lines)
+
+    @staticmethod
+    def compress_context(context: str) -> str:
+        """Drop timestamps, indentation and blank lines from a conversation context block."""
+        return "\n".join(
+            line.strip() for line in context.splitlines()
+            if line.strip() and not line.lstrip().startswith("Timestamp:")
+        )
@@ -1,32 +1,51 @@
+import re
+from functools import lru_cache
+
+def _compile_keywords(keywords) -> re.Pattern:
+    """Compile literal keywords into one alternation matched at the start of a word.
+
+    Inflections still match ("tables", "showing") but a keyword inside another
+    word does not ("min" in "admin", "get" in "target").
+    """
+    return re.compile(r"\b(?:" + "|".join(re.escape(keyword) for keyword in keywords) + ")", re.IGNORECASE)
+
 class QueryClassifier:
     """Classifies user queries into different types."""
-    
+
+    # Schema-related queries
+    SCHEMA_KEYWORDS = ["schema", "table", "tables", "columns", "structure", "describe", "show tables"]
+
+    # Data queries
+    DATA_KEYWORDS = ["select", "show", "find", "get", "count", "sum", "average", "max", "min",
+                     "top", "bottom", "chart", "graph", "plot", "visualize", "analyze"]
+
+    # Single-pass matchers, compiled once at import
+    _schema_pattern = _compile_keywords(SCHEMA_KEYWORDS)
+    _data_pattern = _compile_keywords(DATA_KEYWORDS)
+    _table_pattern = _compile_keywords(["table"])
+    _table_list_pattern = _compile_keywords(["list", "show"])
+
     @staticmethod
+    @lru_cache(maxsize=256)
     def classify_query(query: str) -> str:
         """Classify the type of query."""
-        query_lower = query.lower()
-        
-        # Schema-related queries
-        schema_keywords = ["schema", "table", "tables", "columns", "structure", "describe", "show tables"]
-        if any(keyword in query_lower for keyword in schema_keywords):
-            if "table" in query_lower and ("list" in query_lower or "show" in query_lower):
+        # Patterns are case-insensitive, so the query is matched without a lowercased copy
+        if QueryClassifier._schema_pattern.search(query):
+            if QueryClassifier._table_pattern.search(query) and QueryClassifier._table_list_pattern.search(query):
                 return "table_list"
             return "schema_request"
-        
-        # Data queries
-        data_keywords = ["select", "show", "find", "get", "count", "sum", "average", "max", "min", 
-                        "top", "bottom", "chart", "graph", "plot", "visualize", "analyze"]
-        if any(keyword in query_lower for keyword in data_keywords):
+
+        if QueryClassifier._data_pattern.search(query):
             return "data_query"
-        
+
         # General queries
         return "general"
-    
+
     @staticmethod
     def is_data_query(query: str) -> bool:
         """Check if the query is asking for data."""
         return QueryClassifier.classify_query(query) == "data_query"
-    
+
     @staticmethod
     def is_schema_query(query: str) -> bool:
         """Check if the query is asking for schema information."""
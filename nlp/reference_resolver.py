@@ -1,21 +1,24 @@
+import re
 from typing import Dict, Any
 from langchain.chains import LLMChain
 from langchain_core.prompts import PromptTemplate
 import logging
 
+from .llm_cache import LLMResponseCache
+
+# Reference indicators, matched as whole words
+_REFERENCE_RE = re.compile(
+    r"\b(that|it|this|them|those|these|previous|last|recent|above|earlier|same|similar|also|too|as well)\b",
+    re.IGNORECASE
+)
+
 class ReferenceResolver:
     """Resolves references and pronouns in user queries."""
     
-    def __init__(self, llm):
-        self.llm = llm
+    # Number of (query, context) resolutions remembered per resolver
+    CACHE_SIZE = 256
     
-    def resolve_query_references(self, query: str, context: str) -> str:
-        """Let LLM resolve query references instead of hardcoding patterns."""
-        if not context:
-            return query
-        
-        # Use LLM to resolve references
-        resolution_template = """
+    RESOLUTION_TEMPLATE = """
 You are helping to resolve references in a user query based on conversation context.
 
 Previous Context:
@@ -29,20 +32,37 @@ the previous context, return the original query unchanged.
 
 Only return the resolved query, nothing else:
 """
+    
+    def __init__(self, llm):
+        self.llm = llm
+        self.resolution_chain = LLMChain(
+            llm=llm,
+            prompt=PromptTemplate(input_variables=["query", "context"], template=self.RESOLUTION_TEMPLATE)
+        )
+        self._resolution_cache = LLMResponseCache(self.CACHE_SIZE)
+    
+    def resolve_query_references(self, query: str, context: str) -> str:
+        """Let LLM resolve query references instead of hardcoding patterns."""
+        if not context:
+            return query
         
+        # Identical query in identical context resolves identically
+        cache_key = LLMResponseCache.make_key(query, context)
+        cached = self._resolution_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
+        # Use LLM to resolve references
         try:
-            prompt = PromptTemplate(
-                input_variables=["query", "context"],
-                template=resolution_template
-            )
-            
-            chain = LLMChain(llm=self.llm, prompt=prompt)
-            resolved_query = chain.run({
+            resolved_query = self.resolution_chain.run({
                 "query": query,
                 "context": context
             })
             
-            return resolved_query.strip()
+            resolved_query = resolved_query.strip()
+            self._resolution_cache.put(cache_key, resolved_query)
+            
+            return resolved_query
             
         except Exception as e:
             logging.warning(f"Failed to resolve query references: {str(e)}")
@@ -50,18 +70,12 @@ Only return the resolved query, nothing else:
     
     def detect_references(self, query: str) -> Dict[str, Any]:
         """Detect if query contains references to previous context."""
-        query_lower = query.lower()
-        
-        # Reference indicators
-        reference_indicators = [
-            "that", "it", "this", "them", "those", "these",
-            "previous", "last", "recent", "above", "earlier",
-            "same", "similar", "also", "too", "as well"
-        ]
-        
-        has_references = any(indicator in query_lower for indicator in reference_indicators)
+        # Distinct indicators in order of appearance, from a single scan
+        indicators_found = list(dict.fromkeys(
+            match.group(1).lower() for match in _REFERENCE_RE.finditer(query)
+        ))
         
         return {
-            "has_references": has_references,
-            "indicators_found": [ind for ind in reference_indicators if ind in query_lower]
+            "has_references": bool(indicators_found),
+            "indicators_found": indicators_found
         }
@@ -1,11 +1,69 @@
+import atexit
 import json
 import os
+import re
+import weakref
+from collections import deque
+from itertools import islice
 from datetime import datetime, timedelta
+from functools import cached_property
 from typing import Dict, List, Any, Optional
+import numpy as np
 import pandas as pd
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass, fields
 import logging
 
+# orjson encodes datetimes natively and is several times faster than json
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def _dumps(payload: Dict[str, Any]) -> bytes:
+    """Serialize a session payload, with datetimes as ISO strings."""
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, separators=(",", ":"), default=datetime.isoformat).encode()
+
+def _loads(data: bytes) -> Dict[str, Any]:
+    """Parse a session file written by _dumps (or the older indented JSON)."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+# Follow-up indicators and the narrower categories reported alongside them
+_FOLLOW_UP_INDICATORS = frozenset([
+    "that", "it", "this", "them", "those", "these",
+    "previous", "last", "recent", "above", "earlier",
+    "same", "similar", "also", "too", "as well"
+])
+_PRONOUN_REFERENCES = frozenset(["that", "it", "this", "them", "those", "these"])
+_TIME_REFERENCES = frozenset(["previous", "last", "recent", "earlier", "before"])
+_CONTINUATION_WORDS = frozenset(["also", "too", "as well", "and", "plus", "additionally"])
+
+# Every indicator above, matched as whole words in a single scan
+_FOLLOW_UP_RE = re.compile(
+    r"\b(" + "|".join(map(re.escape, sorted(
+        _FOLLOW_UP_INDICATORS | _PRONOUN_REFERENCES | _TIME_REFERENCES | _CONTINUATION_WORDS
+    ))) + r")\b",
+    re.IGNORECASE
+)
+
+def _row_popcounts(bits: np.ndarray) -> np.ndarray:
+    """Number of set bits in each row of a 2-D uint64 array."""
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(bits).sum(axis=1)
+    # NumPy < 2.0 has no popcount ufunc; count the unpacked bytes instead
+    return np.unpackbits(bits.view(np.uint8), axis=1).sum(axis=1)
+
+# Managers with unflushed changes are written out when the interpreter exits
+_open_managers = weakref.WeakSet()
+
+@atexit.register
+def _flush_open_managers():
+    for manager in list(_open_managers):
+        manager.flush()
+
 @dataclass
 class ConversationItem:
     """Represents a single conversation item."""
@@ -19,22 +77,74 @@ class ConversationItem:
     def __post_init__(self):
         if self.timestamp is None:
             self.timestamp = datetime.now()
+    
+    # Items are not modified after creation, so derived display values are computed once
+    @cached_property
+    def sql_query_stripped(self) -> str:
+        """SQL query without surrounding whitespace ("" when absent)."""
+        return (self.sql_query or "").strip()
+    
+    @cached_property
+    def timestamp_str(self) -> str:
+        """Timestamp formatted for display in context blocks."""
+        return self.timestamp.strftime('%Y-%m-%d %H:%M:%S')
+    
+    @cached_property
+    def query_tokens(self) -> frozenset:
+        """Distinct lowercased words of the query, used for relevance scoring."""
+        return frozenset(self.query.lower().split())
+
+# Persisted ConversationItem fields; cached properties are derived and not saved
+_ITEM_FIELDS = tuple(field.name for field in fields(ConversationItem))
 
 class SessionManager:
     """Manages conversation session memory and context."""
     
+    # Changes coalesced into one session file write
+    FLUSH_EVERY = 10
+    
     def __init__(self, session_id: str, max_history: int = 50):
         self.session_id = session_id
         self.max_history = max_history
-        self.conversation_history: List[ConversationItem] = []
-        self.session_data: Dict[str, Any] = {}
+        self._conversation_history: deque = deque(maxlen=max_history)
+        self._session_data: Dict[str, Any] = {}
+        self._loaded = False
+        self._last_summary: Optional[str] = None
+        # Query tokens interned to bit positions; each history query is kept as a bitset
+        self._vocab: Dict[str, int] = {}
+        self._history_bitsets: deque = deque(maxlen=max_history)
+        self._history_matrix: Optional[np.ndarray] = None
         self.session_file = f"sessions/session_{session_id}.json"
+        self._pending_writes = 0
         
         # Create sessions directory if it doesn't exist
         os.makedirs("sessions", exist_ok=True)
         
-        # Load existing session if available
-        self._load_session()
+        # The existing session, if any, is loaded on first access
+        _open_managers.add(self)
+    
+    @property
+    def conversation_history(self) -> deque:
+        """Conversation items, oldest first."""
+        self._ensure_loaded()
+        return self._conversation_history
+    
+    @property
+    def session_data(self) -> Dict[str, Any]:
+        """Session-specific key/value data."""
+        self._ensure_loaded()
+        return self._session_data
+    
+    @session_data.setter
+    def session_data(self, value: Dict[str, Any]):
+        self._ensure_loaded()
+        self._session_data = value
+    
+    def _ensure_loaded(self):
+        """Load the session file the first time the session is used."""
+        if not self._loaded:
+            self._loaded = True
+            self._load_session()
     
     def add_interaction(self, query: str, response_type: str, 
                        sql_query: Optional[str] = None, 
@@ -49,11 +159,10 @@ class SessionManager:
             context_used=context_used
         )
         
+        # The bounded deque drops the oldest interaction once max_history is reached
         self.conversation_history.append(item)
-        
-        # Keep only the most recent interactions
-        if len(self.conversation_history) > self.max_history:
-            self.conversation_history = self.conversation_history[-self.max_history:]
+        self._index_item(item)
+        self._last_summary = None
         
         # Save session
         self._save_session()
@@ -63,17 +172,26 @@ class SessionManager:
     def get_conversation_history(self, limit: Optional[int] = None) -> List[ConversationItem]:
         """Get conversation history, optionally limited to recent items."""
         if limit:
-            return self.conversation_history[-limit:]
-        return self.conversation_history
+            start = max(len(self.conversation_history) - limit, 0)
+            return list(islice(self.conversation_history, start, None))
+        return list(self.conversation_history)
+    
+    def get_interaction_count(self) -> int:
+        """Get the number of interactions in the history."""
+        return len(self.conversation_history)
     
     def get_last_interaction_summary(self) -> str:
         """Get a detailed summary of the last interaction."""
-        history = self.get_conversation_history(limit=1)
-        
-        if not history:
+        if self._last_summary is None:
+            self._last_summary = self._build_last_interaction_summary()
+        return self._last_summary
+    
+    def _build_last_interaction_summary(self) -> str:
+        """Build the summary returned by get_last_interaction_summary."""
+        if not self.conversation_history:
             return "No previous interactions"
         
-        last_interaction = history[-1]
+        last_interaction = self.conversation_history[-1]
         
         summary_parts = []
         summary_parts.append(f"Last Query: '{last_interaction.query}'")
@@ -110,58 +228,66 @@ class SessionManager:
         
         return "\n".join(context_parts)
     
+    def _index_item(self, item: ConversationItem):
+        """Intern a history item's query words and append its bitset."""
+        bits = [self._vocab.setdefault(word, len(self._vocab)) for word in item.query_tokens]
+        self._history_bitsets.append(bits)
+        self._history_matrix = None
+    
+    def _reindex_history(self):
+        """Rebuild the query bitsets from the current conversation history."""
+        self._vocab.clear()
+        self._history_bitsets.clear()
+        self._history_matrix = None
+        for item in self.conversation_history:
+            self._index_item(item)
+    
+    def _get_history_matrix(self) -> np.ndarray:
+        """History bitsets packed into one uint64 row per query, rebuilt after history changes."""
+        if self._history_matrix is None:
+            matrix = np.zeros((len(self._history_bitsets), len(self._vocab) // 64 + 1), dtype=np.uint64)
+            for row, bits in enumerate(self._history_bitsets):
+                for bit in bits:
+                    matrix[row, bit >> 6] |= np.uint64(1 << (bit & 63))
+            self._history_matrix = matrix
+        return self._history_matrix
+    
     def find_relevant_context(self, current_query: str, similarity_threshold: float = 0.3) -> List[ConversationItem]:
         """Find relevant previous interactions based on query similarity."""
-        relevant_items = []
-        current_query_lower = current_query.lower()
+        if not self.conversation_history:
+            return []
         
         # Simple keyword-based relevance (can be enhanced with embeddings)
-        for item in self.conversation_history:
-            item_query_lower = item.query.lower()
-            
-            # Check for common words
-            current_words = set(current_query_lower.split())
-            item_words = set(item_query_lower.split())
-            
-            # Calculate simple Jaccard similarity
-            intersection = current_words.intersection(item_words)
-            union = current_words.union(item_words)
-            
-            if union:
-                similarity = len(intersection) / len(union)
-                if similarity >= similarity_threshold:
-                    relevant_items.append(item)
+        history = self._get_history_matrix()
+        current_words = set(current_query.lower().split())
+        query_bits = np.zeros(history.shape[1], dtype=np.uint64)
+        for word in current_words:
+            bit = self._vocab.get(word)
+            # Words never seen in history add to the union only
+            if bit is not None:
+                query_bits[bit >> 6] |= np.uint64(1 << (bit & 63))
+        
+        # Jaccard similarity from popcounts; |A ∪ B| = |A| + |B| - |A ∩ B|
+        intersection = _row_popcounts(history & query_bits)
+        union = _row_popcounts(history) + len(current_words) - intersection
+        with np.errstate(divide="ignore", invalid="ignore"):
+            similarity = intersection / union
+        relevant = np.flatnonzero((union > 0) & (similarity >= similarity_threshold))
         
-        return relevant_items[-3:]  # Return up to 3 most recent relevant items
+        return [self.conversation_history[i] for i in relevant[-3:]]  # Return up to 3 most recent relevant items
     
     def detect_follow_up_patterns(self, query: str) -> Dict[str, Any]:
         """Detect if the query is a follow-up question."""
-        query_lower = query.lower()
-        
-        # Follow-up indicators
-        follow_up_indicators = [
-            "that", "it", "this", "them", "those", "these",
-            "previous", "last", "recent", "above", "earlier",
-            "same", "similar", "also", "too", "as well"
-        ]
-        
-        # Pronoun references
-        pronoun_references = ["that", "it", "this", "them", "those", "these"]
-        
-        # Time references
-        time_references = ["previous", "last", "recent", "earlier", "before"]
-        
-        # Continuation words
-        continuation_words = ["also", "too", "as well", "and", "plus", "additionally"]
-        
-        is_follow_up = any(indicator in query_lower for indicator in follow_up_indicators)
+        # Distinct indicators in order of appearance, from a single scan
+        hits = list(dict.fromkeys(match.group(1).lower() for match in _FOLLOW_UP_RE.finditer(query)))
+        indicators_found = [hit for hit in hits if hit in _FOLLOW_UP_INDICATORS]
         
         follow_up_info = {
-            "is_follow_up": is_follow_up,
-            "has_pronouns": any(pronoun in query_lower for pronoun in pronoun_references),
-            "has_time_refs": any(time_ref in query_lower for time_ref in time_references),
-            "has_continuation": any(cont in query_lower for cont in continuation_words),
-            "indicators_found": [ind for ind in follow_up_indicators if ind in query_lower]
+            "is_follow_up": bool(indicators_found),
+            "has_pronouns": any(hit in _PRONOUN_REFERENCES for hit in hits),
+            "has_time_refs": any(hit in _TIME_REFERENCES for hit in hits),
+            "has_continuation": any(hit in _CONTINUATION_WORDS for hit in hits),
+            "indicators_found": indicators_found
         }
         
         return follow_up_info
@@ -184,48 +310,70 @@ class SessionManager:
     
     def clear_session(self):
         """Clear the current session."""
-        self.conversation_history = []
+        self.conversation_history.clear()
+        self._reindex_history()
         self.session_data = {}
+        self._last_summary = None
         self._save_session()
+        self.flush()
         logging.info(f"Cleared session {self.session_id}")
     
     def _save_session(self):
-        """Save session to file."""
+        """Record a change, writing the session file once FLUSH_EVERY changes have accumulated."""
+        self._pending_writes += 1
+        if self._pending_writes >= self.FLUSH_EVERY:
+            self.flush()
+    
+    def flush(self):
+        """Write pending session changes to file."""
+        if not self._pending_writes:
+            return
+        
         try:
             session_data = {
                 "session_id": self.session_id,
                 "conversation_history": [
-                    {
-                        **asdict(item),
-                        "timestamp": item.timestamp.isoformat()
-                    }
+                    {name: getattr(item, name) for name in _ITEM_FIELDS}
                     for item in self.conversation_history
                 ],
                 "session_data": self.session_data,
-                "last_updated": datetime.now().isoformat()
+                "last_updated": datetime.now()
             }
             
-            with open(self.session_file, 'w') as f:
-                json.dump(session_data, f, indent=2)
+            with open(self.session_file, 'wb') as f:
+                f.write(_dumps(session_data))
+            self._pending_writes = 0
                 
         except Exception as e:
             logging.error(f"Failed to save session: {str(e)}")
     
+    def close(self):
+        """Write pending session changes; the manager stays usable afterwards."""
+        self.flush()
+    
+    def __del__(self):
+        # A manager kept in st.session_state is collected when its browser session expires,
+        # long before the atexit flush runs, so write out what is still pending
+        if getattr(self, "_pending_writes", 0):
+            self.flush()
+    
     def _load_session(self):
         """Load session from file."""
         try:
             if os.path.exists(self.session_file):
-                with open(self.session_file, 'r') as f:
-                    session_data = json.load(f)
+                with open(self.session_file, 'rb') as f:
+                    session_data = _loads(f.read())
                 
-                # Load conversation history
-                self.conversation_history = []
-                for item_data in session_data.get("conversation_history", []):
+                # Load conversation history; items beyond max_history would be dropped anyway
+                self._conversation_history.clear()
+                self._last_summary = None
+                for item_data in session_data.get("conversation_history", [])[-self.max_history:]:
                     item_data["timestamp"] = datetime.fromisoformat(item_data["timestamp"])
-                    self.conversation_history.append(ConversationItem(**item_data))
+                    self._conversation_history.append(ConversationItem(**item_data))
+                self._reindex_history()
                 
                 # Load session data
-                self.session_data = session_data.get("session_data", {})
+                self._session_data = session_data.get("session_data", {})
                 
                 logging.info(f"Loaded session {self.session_id}")
                 
@@ -235,16 +383,15 @@ class SessionManager:
     def cleanup_old_sessions(self, days_old: int = 7):
         """Clean up old session files."""
         try:
-            cutoff_date = datetime.now() - timedelta(days=days_old)
+            # Compare raw mtimes; scandir entries carry their stat results
+            cutoff = (datetime.now() - timedelta(days=days_old)).timestamp()
             
-            for filename in os.listdir("sessions"):
-                if filename.startswith("session_") and filename.endswith(".json"):
-                    file_path = os.path.join("sessions", filename)
-                    file_time = datetime.fromtimestamp(os.path.getmtime(file_path))
-                    
-                    if file_time < cutoff_date:
-                        os.remove(file_path)
-                        logging.info(f"Cleaned up old session file: {filename}")
+            with os.scandir("sessions") as entries:
+                for entry in entries:
+                    if (entry.name.startswith("session_") and entry.name.endswith(".json")
+                            and entry.stat().st_mtime < cutoff):
+                        os.remove(entry.path)
+                        logging.info(f"Cleaned up old session file: {entry.name}")
                         
         except Exception as e:
             logging.error(f"Failed to cleanup old sessions: {str(e)}")
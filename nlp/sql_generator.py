@@ -1,137 +1,122 @@
 import re
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 from langchain.chains import LLMChain
 from langchain_core.prompts import PromptTemplate
 import logging
 
+from .llm_cache import LLMResponseCache
+from .database_templates import DatabaseTemplates
+from utils.sql_safety import is_safe_select
+
+# A SELECT opening a line (or a code block) runs to its ';' (kept), a fence or the end;
+# one found mid-sentence is the fallback, ending at ';', a blank line or a fence
+_SQL_AT_LINE_START_RE = re.compile(r"^[ \t\r]*(select\b.*?)(?:(;)|```|\Z)", re.IGNORECASE | re.MULTILINE | re.DOTALL)
+_SQL_IN_TEXT_RE = re.compile(r"(select\b.*?)(?:;|\n\n|```|\Z)", re.IGNORECASE | re.DOTALL)
+_FROM_RE = re.compile(r"\bFROM\b", re.IGNORECASE)
+# A row limit on the outer statement: a trailing LIMIT n [OFFSET m] / LIMIT m, n or FETCH FIRST clause;
+# a LIMIT inside a CTE or subquery is followed by more SQL and does not match
+_TRAILING_LIMIT_RE = re.compile(
+    r"(?:\bLIMIT\s+\d+(?:\s*,\s*\d+|\s+OFFSET\s+\d+)?"
+    r"|\bFETCH\s+(?:FIRST|NEXT)\s+(?:\d+\s+)?ROWS?\s+(?:ONLY|WITH\s+TIES))\s*\Z",
+    re.IGNORECASE
+)
+# PostgreSQL's explicit "no limit", which the cap replaces
+_TRAILING_LIMIT_ALL_RE = re.compile(r"\bLIMIT\s+ALL(?=(?:\s+OFFSET\s+\d+)?\s*\Z)", re.IGNORECASE)
+# Comments and ';' after the last clause, removed before the limit is checked or appended
+_TRAILING_NOISE_RE = re.compile(r"(?:\s|;|--[^\n]*|/\*.*?\*/)*\Z", re.DOTALL)
+
 class SQLGenerator:
     """Handles SQL generation and validation."""
     
+    # Upper bound on rows returned by a generated query without its own LIMIT
+    MAX_RESULT_ROWS = 10000
+    
+    EXPLANATION_TEMPLATE = """
+Explain this SQL query in simple terms for a business user:
+
+Original Question: {question}
+SQL Query: {sql}
+
+Explanation:
+"""
+    
     def __init__(self, llm, db_connector):
         self.llm = llm
         self.db_connector = db_connector
+        self._explanation_cache = LLMResponseCache()
+        self.explanation_chain = LLMChain(
+            llm=llm,
+            prompt=PromptTemplate(input_variables=["question", "sql"], template=self.EXPLANATION_TEMPLATE)
+        )
     
-    def generate_sql(self, query: str, context: str, sql_template: str) -> str:
+    def generate_sql(self, query: str, context: str, sql_template: str, schema_info: Optional[str] = None) -> str:
         """Generate SQL query using the provided template."""
         try:
-            # Get schema information
-            schema_info = self.db_connector.get_schema_info()
-            
-            # Create prompt template
-            prompt = PromptTemplate(
-                input_variables=["question", "schema", "context"],
-                template=sql_template
-            )
+            # Get schema information unless the caller already fetched it
+            if schema_info is None:
+                schema_info = self.db_connector.get_schema_info()
             
-            # Generate SQL query
-            chain = LLMChain(llm=self.llm, prompt=prompt)
-            llm_response = chain.run({
-                "question": query,
-                "schema": schema_info,
-                "context": context
-            })
+            # Only the question and context vary per call; the schema is pre-rendered
+            prompt = DatabaseTemplates.specialize_template(sql_template, schema_info)
+            llm_response = self.llm.invoke(prompt.format(question=query, context=context)).content
             
-            # Extract SQL from response
-            sql_query = self._extract_sql(llm_response)
-            
-            # Validate SQL query
-            if not self._validate_sql(sql_query):
-                raise ValueError("Generated SQL query failed validation")
-            
-            return sql_query
+            return self.extract_valid_sql(llm_response)
             
         except Exception as e:
             logging.error(f"SQL generation failed: {str(e)}")
             raise ValueError(f"Failed to generate SQL query: {str(e)}")
     
+    def extract_valid_sql(self, llm_response: str) -> str:
+        """Extract the SQL query from an LLM response and validate it."""
+        sql_query = self._extract_sql(llm_response)
+        
+        if not self._validate_sql(sql_query):
+            raise ValueError("Generated SQL query failed validation")
+        
+        return self._apply_row_limit(sql_query)
+    
+    def _apply_row_limit(self, sql_query: str) -> str:
+        """Cap queries without a LIMIT so results stay bounded in memory."""
+        statement = _TRAILING_NOISE_RE.sub("", sql_query.strip())
+        if _TRAILING_LIMIT_RE.search(statement):
+            return sql_query
+        if _TRAILING_LIMIT_ALL_RE.search(statement):
+            return _TRAILING_LIMIT_ALL_RE.sub(f"LIMIT {self.MAX_RESULT_ROWS}", statement)
+        
+        return f"{statement}\nLIMIT {self.MAX_RESULT_ROWS}"
+    
     def _extract_sql(self, text_response: str) -> str:
         """Extract SQL query from LLM response."""
         # Remove any markdown formatting
-        text_response = text_response.strip()
+        text = text_response.strip()
         
-        # Try to extract code block inside triple backticks
-        match = re.search(r"``````", text_response, re.DOTALL | re.IGNORECASE)
+        match = _SQL_AT_LINE_START_RE.search(text)
         if match:
-            return match.group(1).strip()
-        
-        # Try to find SQL query starting with SELECT
-        lines = text_response.split('\n')
-        sql_lines = []
-        found_select = False
+            sql, terminator = match.groups()
+            return sql + terminator if terminator else sql.strip()
         
-        for line in lines:
-            line = line.strip()
-            if line.upper().startswith('SELECT'):
-                found_select = True
-            if found_select:
-                sql_lines.append(line)
-                if line.endswith(';'):
-                    break
-        
-        if sql_lines:
-            return '\n'.join(sql_lines)
-        
-        # If no clear SQL found, try to extract from the entire response
-        if 'SELECT' in text_response.upper():
-            # Find the position of SELECT and extract from there
-            select_pos = text_response.upper().find('SELECT')
-            potential_sql = text_response[select_pos:].strip()
-            
-            # Try to find the end of the SQL query
-            end_markers = [';', '\n\n', '```']
-
-            for marker in end_markers:
-                if marker in potential_sql:
-                    potential_sql = potential_sql[:potential_sql.find(marker)]
-                    break
-            
-            return potential_sql.strip()
+        match = _SQL_IN_TEXT_RE.search(text)
+        if match:
+            return match.group(1).strip()
         
         raise ValueError("No SQL query found in the LLM response")
     
     def _validate_sql(self, sql_query: str) -> bool:
         """Validate the generated SQL query."""
-        if not sql_query:
-            return False
-        
-        sql_upper = sql_query.upper().strip()
-        
-        # Must start with SELECT
-        if not sql_upper.startswith('SELECT'):
-            return False
-        
-        # Should not contain dangerous operations
-        dangerous_keywords = ['DROP', 'DELETE', 'UPDATE', 'INSERT', 'ALTER', 'CREATE', 'TRUNCATE']
-        for keyword in dangerous_keywords:
-            if keyword in sql_upper:
-                return False
-        
-        # Basic syntax check
-        if 'SELECT' not in sql_upper or 'FROM' not in sql_upper:
-            return False
-        
-        return True
+        # Must start with SELECT, have a FROM and no data-modifying statement
+        return bool(sql_query and is_safe_select(sql_query) and _FROM_RE.search(sql_query))
     
     def generate_explanation(self, sql_query: str, user_query: str) -> str:
         """Generate explanation for the SQL query."""
+        cache_key = LLMResponseCache.make_key(sql_query, user_query)
+        cached = self._explanation_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
         try:
-            explanation_template = """
-Explain this SQL query in simple terms for a business user:
-
-Original Question: {question}
-SQL Query: {sql}
-
-Explanation:
-"""
-            
-            prompt = PromptTemplate(
-                input_variables=["question", "sql"],
-                template=explanation_template
-            )
-            
-            chain = LLMChain(llm=self.llm, prompt=prompt)
-            explanation = chain.run({"question": user_query, "sql": sql_query})
+            explanation = self.explanation_chain.run({"question": user_query, "sql": sql_query})
             
+            self._explanation_cache.put(cache_key, explanation)
             return explanation
             
         except Exception as e:
@@ -0,0 +1,148 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("langchain")
+pytest.importorskip("langchain_groq")
+pytest.importorskip("dotenv")
+
+from visualization.chart_generator import ChartGenerator
+
+
+@pytest.fixture
+def generator():
+    # Rendering helpers only use class settings, so the LLM client is not needed
+    return object.__new__(ChartGenerator)
+
+
+def test_long_scatter_traces_render_as_webgl(generator):
+    n = ChartGenerator.WEBGL_THRESHOLD + 500
+    df = pd.DataFrame({"x": np.arange(n), "y": np.random.rand(n)})
+
+    fig = generator._render_chart(df, "fig = go.Figure(go.Scatter(x=df.x, y=df.y, mode='lines'))")
+
+    assert fig is not None
+    assert [trace.type for trace in fig.data] == ["scattergl"]
+
+
+def test_short_scatter_traces_stay_svg(generator):
+    df = pd.DataFrame({"x": [1, 2, 3], "y": [4, 5, 6]})
+
+    fig = generator._render_chart(df, "fig = px.scatter(df, x='x', y='y', title='t')")
+
+    assert [trace.type for trace in fig.data] == ["scatter"]
+    assert fig.layout.title.text == "t"
+
+
+class _StubChain:
+    def __init__(self, reply):
+        self.reply = reply
+        self.calls = 0
+
+    def run(self, inputs):
+        self.calls += 1
+        return self.reply
+
+
+def test_rejected_chart_code_falls_back_and_is_not_cached(generator):
+    from nlp.llm_cache import LLMResponseCache
+
+    generator._code_cache = LLMResponseCache()
+    generator.chart_chain = _StubChain(
+        "import plotly.figure_factory as ff\nfig = ff.create_table(df)"
+    )
+    df = pd.DataFrame({"region": ["a", "b"], "amount": [1, 2]})
+
+    fig = generator.generate_chart(df, "amount by region")
+    generator.generate_chart(df, "amount by region")
+
+    assert [trace.type for trace in fig.data] == ["bar"]
+    assert generator.chart_chain.calls == 2
+
+
+def _arrow_result() -> pd.DataFrame:
+    # Shaped like an execute_query result read with DTYPE_BACKEND = "pyarrow"
+    df = pd.DataFrame({
+        "region": ["north", "south", None, "north"],
+        "orders": [3, None, 5, 7],
+        "amount": [10.5, 20.0, 7.25, None],
+        "day": pd.to_datetime(["2020-01-01", "2020-01-02", "2020-01-03", "2020-01-04"]),
+    })
+    return df.convert_dtypes(dtype_backend="pyarrow")
+
+
+def test_fallback_chart_renders_arrow_backed_results(generator):
+    from nlp.llm_cache import LLMResponseCache
+
+    generator._code_cache = LLMResponseCache()
+    generator.chart_chain = _StubChain("this is not python (")
+    df = _arrow_result()
+
+    fig = generator.generate_chart(df, "amount over time")
+
+    assert [trace.type for trace in fig.data] == ["scatter"]
+
+
+@pytest.mark.parametrize("code", [
+    "numeric = df.select_dtypes(include='number').columns\n"
+    "fig = px.bar(df, x='region', y=numeric[0])",
+    "text_cols = df.select_dtypes(include='object').columns\n"
+    "fig = px.bar(df.groupby(text_cols[0])['amount'].sum().reset_index(), x=text_cols[0], y='amount')",
+    "cols = [c for c in df.columns if np.issubdtype(df[c].dtype, np.number)]\n"
+    "fig = px.scatter(df, x=cols[0], y=cols[1])",
+    "fig = px.line(df.sort_values('day'), x='day', y='amount', markers=True)",
+])
+def test_typical_chart_code_runs_on_arrow_backed_results(generator, code):
+    from nlp.llm_cache import LLMResponseCache
+
+    generator._code_cache = LLMResponseCache()
+    generator.chart_chain = _StubChain(code)
+
+    fig = generator.generate_chart(_arrow_result(), "chart")
+
+    assert fig is not None
+    assert len(fig.data) >= 1
+
+
+def test_normalized_queries_keep_punctuation():
+    assert ChartGenerator._normalize_query("  Revenue   BY Month ") == "revenue by month"
+    assert (ChartGenerator._normalize_query("revenue where amount > 100")
+            != ChartGenerator._normalize_query("revenue where amount < 100"))
+    assert ChartGenerator._normalize_query("2019-2020") != ChartGenerator._normalize_query("2019 2020")
+
+
+def test_chart_code_failing_at_runtime_is_not_cached(generator):
+    from nlp.llm_cache import LLMResponseCache
+
+    generator._code_cache = LLMResponseCache()
+    generator.chart_chain = _StubChain("fig = px.bar(df, x='regoin', y='amount')")
+    df = pd.DataFrame({"region": ["a", "b"], "amount": [1, 2]})
+
+    generator.generate_chart(df, "amount by region")
+    generator.generate_chart(df, "amount by region")
+
+    assert generator.chart_chain.calls == 2
+
+
+def test_chart_code_may_use_common_builtins(generator):
+    df = pd.DataFrame({"region": ["a", "b"], "amount": [1, 2]})
+    code = (
+        "cols = [c for c in df.columns if hasattr(df[c], 'str') and type(df[c]) is pd.Series]\n"
+        "fig = px.bar(df, x=cols[0], y='amount')"
+    )
+
+    fig = generator._render_chart(df, code)
+
+    assert [trace.type for trace in fig.data] == ["bar"]
+
+
+def test_chart_code_failing_at_runtime_renders_the_fallback_chart(generator):
+    from nlp.llm_cache import LLMResponseCache
+
+    generator._code_cache = LLMResponseCache()
+    generator.chart_chain = _StubChain("fig = px.bar(df, x='regoin', y='amount')")
+    df = pd.DataFrame({"region": ["a", "b"], "amount": [1, 2]})
+
+    fig = generator.generate_chart(df, "amount by region")
+
+    assert [trace.type for trace in fig.data] == ["bar"]
@@ -0,0 +1,60 @@
+import pandas as pd
+import pytest
+
+pytest.importorskip("psycopg2")
+pytest.importorskip("sqlalchemy")
+
+from utils.postgres_connector import PostgreSQLConnector
+
+
+def _schema_rows() -> pd.DataFrame:
+    return pd.DataFrame({
+        "table_name": ["orders", "orders", "empty"],
+        "column_name": ["id", "note", None],
+        "data_type": ["integer", "text", None],
+        "is_nullable": ["NO", "YES", None],
+        "column_default": [None, "''::text", None],
+        "key_type": ["PK", None, None],
+    })
+
+
+@pytest.mark.parametrize("dtype_backend", ["numpy_nullable", "pyarrow"])
+def test_format_schema_keeps_tables_without_columns(dtype_backend):
+    rows = _schema_rows().convert_dtypes(dtype_backend=dtype_backend)
+
+    schema = PostgreSQLConnector._format_schema(rows)
+
+    assert schema == (
+        "Table: orders\n"
+        "  - id: integer (PK) NOT NULL\n"
+        "  - note: text NULL DEFAULT ''::text\n"
+        "\n"
+        "Table: empty\n"
+    )
+
+
+def test_format_schema_of_empty_result():
+    assert PostgreSQLConnector._format_schema(pd.DataFrame()) == ""
+
+
+def test_connectorx_uri_percent_encodes_credentials_and_keeps_sslmode(monkeypatch):
+    monkeypatch.setattr(PostgreSQLConnector, "_connect", lambda self: None)
+
+    connector = PostgreSQLConnector("db", 5432, "sales", "an alyst", "p@ss word+1")
+
+    assert connector.cx_uri == "postgresql://an%20alyst:p%40ss%20word%2B1@db:5432/sales?sslmode=prefer"
+
+
+@pytest.mark.parametrize("message", [
+    'error connecting to server: FATAL: password authentication failed for user "analyst"',
+    "db error: FATAL: no pg_hba.conf entry for host \"10.0.0.1\", SSL off",
+    "error performing TLS handshake: invalid certificate",
+])
+def test_connectorx_connection_failures_fall_back(message):
+    assert PostgreSQLConnector._connectorx_can_fall_back(RuntimeError(message))
+
+
+def test_connectorx_sql_errors_propagate():
+    error = RuntimeError('db error: ERROR: column "host" does not exist')
+
+    assert not PostgreSQLConnector._connectorx_can_fall_back(error)
@@ -0,0 +1,23 @@
+from nlp.prompt_compressor import PromptCompressor
+
+
+def test_compress_schema_drops_only_the_nullability_token():
+    schema = (
+        "Table: orders\n"
+        "  - id: integer (PK) NOT NULL\n"
+        "  - note: text NULL DEFAULT NULL\n"
+        "  - status: varchar NULL DEFAULT 'new'\n"
+        "\n"
+        "Table: empty\n"
+    )
+
+    assert PromptCompressor.compress_schema(schema) == (
+        "orders(id integer PK NOT NULL, note text DEFAULT NULL, status varchar DEFAULT 'new')\n"
+        "empty()"
+    )
+
+
+def test_compress_context_drops_timestamps_and_blank_lines():
+    context = "  User: show sales\n\n  Timestamp: 2024-01-01\n  SQL: SELECT 1\n"
+
+    assert PromptCompressor.compress_context(context) == "User: show sales\nSQL: SELECT 1"
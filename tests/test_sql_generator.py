@@ -0,0 +1,48 @@
+import pytest
+
+pytest.importorskip("langchain")
+
+from nlp.sql_generator import SQLGenerator
+
+
+@pytest.fixture
+def generator():
+    # Row limiting only uses class settings, so the LLM is not needed
+    return object.__new__(SQLGenerator)
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT * FROM orders LIMIT 50",
+    "SELECT * FROM orders LIMIT 50 OFFSET 100;",
+    "SELECT * FROM orders LIMIT 100, 50",
+    "SELECT * FROM orders ORDER BY id OFFSET 10 ROWS FETCH FIRST 5 ROWS ONLY",
+    "SELECT * FROM orders LIMIT 10 -- top ten",
+    "SELECT * FROM orders LIMIT 10; /* top ten */",
+])
+def test_trailing_limit_is_kept(generator, sql):
+    assert generator._apply_row_limit(sql) == sql
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT * FROM orders",
+    "WITH t AS (SELECT id FROM top_customers LIMIT 5) SELECT * FROM orders JOIN t ON t.id = orders.id",
+    "SELECT * FROM orders WHERE customer_id IN (SELECT id FROM customers LIMIT 5);",
+])
+def test_outer_select_without_limit_is_capped(generator, sql):
+    capped = generator._apply_row_limit(sql)
+
+    assert capped == f"{sql.rstrip(';')}\nLIMIT {SQLGenerator.MAX_RESULT_ROWS}"
+
+
+def test_trailing_comment_is_dropped_before_the_cap(generator):
+    capped = generator._apply_row_limit("SELECT * FROM orders -- every order\n")
+
+    assert capped == f"SELECT * FROM orders\nLIMIT {SQLGenerator.MAX_RESULT_ROWS}"
+
+
+@pytest.mark.parametrize("sql, expected", [
+    ("SELECT * FROM orders LIMIT ALL", "SELECT * FROM orders LIMIT {cap}"),
+    ("SELECT * FROM orders LIMIT ALL OFFSET 20;", "SELECT * FROM orders LIMIT {cap} OFFSET 20"),
+])
+def test_limit_all_is_replaced_by_the_cap(generator, sql, expected):
+    assert generator._apply_row_limit(sql) == expected.format(cap=SQLGenerator.MAX_RESULT_ROWS)
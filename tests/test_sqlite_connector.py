@@ -0,0 +1,107 @@
+import io
+import sqlite3
+
+import pytest
+
+pytest.importorskip("sqlalchemy")
+pytest.importorskip("streamlit")
+
+from utils.sqlite_connector import SQLiteConnector
+
+
+@pytest.fixture
+def connector(tmp_path):
+    path = tmp_path / "test.db"
+    with sqlite3.connect(path) as conn:
+        conn.executescript("""
+            CREATE TABLE orders (id INTEGER PRIMARY KEY, amount REAL);
+            INSERT INTO orders VALUES (1, 9.5), (2, 20.0);
+            CREATE TABLE mixed (value);
+            INSERT INTO mixed VALUES (1), ('a'), (2.5);
+        """)
+    connector = SQLiteConnector(database_path=str(path))
+    yield connector
+    connector.close()
+
+
+def test_execute_query_reads_rows(connector):
+    df = connector.execute_query("SELECT id, amount FROM orders ORDER BY id")
+
+    assert df["id"].tolist() == [1, 2]
+    assert df["amount"].tolist() == [9.5, 20.0]
+
+
+def test_mixed_type_columns_fall_back_to_sqlalchemy(connector):
+    df = connector.execute_query("SELECT value FROM mixed")
+
+    assert [str(value) for value in df["value"]] == ["1", "a", "2.5"]
+
+
+def test_sql_errors_propagate(connector):
+    with pytest.raises(Exception, match="nope"):
+        connector.execute_query("SELECT nope FROM orders")
+
+
+@pytest.mark.parametrize("message, can_fall_back", [
+    ("Invalid column type Text at index: 0, name: value", True),
+    ("not implemented: Unknown not implemented!", True),
+    ("no such column: nope in SELECT nope FROM orders", False),
+    ('near "selec": syntax error', False),
+])
+def test_connectorx_fallback_is_limited_to_unsupported_types(message, can_fall_back):
+    assert SQLiteConnector._connectorx_can_fall_back(RuntimeError(message)) is can_fall_back
+
+
+class _Upload(io.BytesIO):
+    """Minimal stand-in for a Streamlit UploadedFile."""
+
+    def __init__(self, name: str, content: bytes):
+        super().__init__(content)
+        self.name = name
+
+
+def test_bulk_load_rolls_back_only_the_failed_file(monkeypatch):
+    connector = SQLiteConnector()
+    load_dataframe = connector._load_dataframe
+
+    def fail_after_loading(conn, df, table_name):
+        load_dataframe(conn, df, table_name)
+        if table_name == "broken":
+            raise ValueError("load interrupted")
+
+    monkeypatch.setattr(connector, "_load_dataframe", fail_after_loading)
+    try:
+        created = connector.bulk_create_tables_from_csv([
+            _Upload("first.csv", b"a,b\n1,x\n2,y\n"),
+            _Upload("broken.csv", b"a\n1\n"),
+            _Upload("last.csv", b"c\n3\n"),
+        ])
+
+        assert created == 2
+        assert sorted(connector.get_tables()) == ["first", "last"]
+        assert connector.execute_query('SELECT COUNT(*) AS n FROM "first"')["n"].tolist() == [2]
+    finally:
+        connector.close()
+
+
+def test_connector_reports_its_database_type(connector):
+    assert connector.db_type == "sqlite"
+
+
+def test_row_count_estimate_ignores_partial_indexes(tmp_path):
+    path = tmp_path / "stats.db"
+    with sqlite3.connect(path) as conn:
+        conn.executescript("""
+            CREATE TABLE events (id INTEGER PRIMARY KEY, flagged INTEGER);
+            WITH RECURSIVE n(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM n WHERE x < 100)
+            INSERT INTO events SELECT x, x % 10 = 0 FROM n;
+            CREATE INDEX events_flagged ON events (id) WHERE flagged = 1;
+            CREATE INDEX events_flag ON events (flagged);
+            ANALYZE;
+        """)
+    connector = SQLiteConnector(database_path=str(path))
+    try:
+        assert connector._estimated_row_count("events") == 100
+        assert connector._estimated_row_count("missing") is None
+    finally:
+        connector.close()
@@ -1,10 +1,135 @@
+import atexit
+import re
+import threading
+import time
 from abc import ABC, abstractmethod
 import pandas as pd
-from typing import List, Dict, Optional
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import Engine
+from typing import Any, Callable, Iterator, List, Dict, Optional
+from .sql_safety import starts_with_select, find_dangerous_keyword
+
+# ConnectorX failures caused by a column type or URI it cannot handle; SQL errors do not match
+_CONNECTORX_UNSUPPORTED_RE = re.compile(
+    r"not implemented|unsupported|not supported|invalid column type|no conversion|cannot infer",
+    re.IGNORECASE
+)
+
+# ConnectorX failures to connect, authenticate or negotiate TLS; the SQLAlchemy driver may still succeed
+_CONNECTORX_CONNECT_RE = re.compile(
+    r"error connecting|could not connect|can't connect|failed to connect|connection (?:refused|reset|closed)"
+    r"|authentication failed|access denied for user|pg_hba\.conf|\bssl\b|\btls\b|certificate|handshake"
+    r"|timed out|name or service not known|could not translate host name|broken pipe|unexpected eof",
+    re.IGNORECASE
+)
+
+# Engines (and their pools) shared by every connector built for the same connection string
+_engines: Dict[str, Engine] = {}
+_engines_lock = threading.Lock()
+
+def get_shared_engine(connection_string: str, on_create: Optional[Callable[[Engine], None]] = None,
+                      **engine_kwargs) -> Engine:
+    """Return the process-wide engine for connection_string, creating it on first use."""
+    with _engines_lock:
+        engine = _engines.get(connection_string)
+        if engine is None:
+            engine = create_engine(connection_string, **engine_kwargs)
+            if on_create is not None:
+                on_create(engine)
+            _engines[connection_string] = engine
+        return engine
+
+@atexit.register
+def _dispose_shared_engines():
+    """Close every pooled connection when the process exits."""
+    with _engines_lock:
+        for engine in _engines.values():
+            engine.dispose()
+        _engines.clear()
 
 class BaseConnector(ABC):
     """Abstract base class for database connectors."""
     
+    # Database type name, as used for prompt templates and index cache directories
+    db_type = ""
+    
+    # Rows fetched per batch when results are streamed from a server-side cursor
+    READ_CHUNK_SIZE = 10000
+    
+    # Seconds catalog results (tables, schema, columns) are reused before being read again
+    METADATA_TTL = 300
+    
+    # Query results use Arrow-backed columns: compact strings and nullable integers that stay integers
+    DTYPE_BACKEND = "pyarrow"
+    
+    def __init__(self):
+        self._metadata_cache: Dict[tuple, tuple] = {}
+        self._metadata_lock = threading.Lock()
+    
+    def _cached_metadata(self, key: tuple, load: Callable[[], Any]) -> Any:
+        """Return a cached catalog result, calling load when it is missing or expired."""
+        with self._metadata_lock:
+            entry = self._metadata_cache.get(key)
+        if entry is not None and time.monotonic() - entry[0] < self.METADATA_TTL:
+            return entry[1]
+        
+        # Failures raise out of load and are not cached
+        value = load()
+        with self._metadata_lock:
+            self._metadata_cache[key] = (time.monotonic(), value)
+        return value
+    
+    def invalidate_metadata(self):
+        """Drop cached catalog results, e.g. after tables are created."""
+        with self._metadata_lock:
+            self._metadata_cache.clear()
+    
+    @staticmethod
+    def _connectorx_can_fall_back(error: BaseException) -> bool:
+        """Check whether a ConnectorX failure means the query needs another reader, not that it is wrong."""
+        # Unimplemented conversions surface as Rust panics, which derive from BaseException
+        if type(error).__name__ == "PanicException":
+            return True
+        message = str(error)
+        return bool(_CONNECTORX_UNSUPPORTED_RE.search(message) or _CONNECTORX_CONNECT_RE.search(message))
+    
+    @staticmethod
+    def _check_query_safety(query: str):
+        """Raise ValueError for a non-SELECT query containing a data-modifying keyword."""
+        # Catalog statements such as SHOW TABLES are allowed; only SELECTs skip the scan
+        if starts_with_select(query):
+            return
+        keyword = find_dangerous_keyword(query)
+        if keyword:
+            raise ValueError(f"Dangerous operation detected: {keyword}")
+    
+    def iter_chunks(self, query: str, chunksize: Optional[int] = None) -> Iterator[pd.DataFrame]:
+        """Stream query results as DataFrames of at most chunksize rows."""
+        query = query.strip()
+        self._check_query_safety(query)
+        return self._stream_chunks(query, chunksize or self.READ_CHUNK_SIZE)
+    
+    def _stream_chunks(self, query: str, chunksize: int) -> Iterator[pd.DataFrame]:
+        """Stream an already checked query from a server-side cursor."""
+        with self.engine.connect().execution_options(stream_results=True, max_row_buffer=chunksize) as conn:
+            yield from pd.read_sql_query(text(query), conn, chunksize=chunksize, dtype_backend=self.DTYPE_BACKEND)
+    
+    def _arrow_types_mapper(self) -> Optional[Callable]:
+        """types_mapper keeping Arrow columns Arrow-backed when DTYPE_BACKEND is pyarrow."""
+        return pd.ArrowDtype if self.DTYPE_BACKEND == "pyarrow" else None
+    
+    def _read_catalog(self, statement, **params) -> pd.DataFrame:
+        """Run a parameterized catalog or sample query."""
+        with self.engine.connect() as conn:
+            return pd.read_sql_query(statement, conn, params=params)
+    
+    def _read_sql_streamed(self, query: str) -> pd.DataFrame:
+        """Read a query execute_query has already checked, one chunk at a time."""
+        chunks = list(self._stream_chunks(query, self.READ_CHUNK_SIZE))
+        if not chunks:
+            return pd.DataFrame()
+        return chunks[0] if len(chunks) == 1 else pd.concat(chunks, ignore_index=True)
+    
     @abstractmethod
     def test_connection(self) -> bool:
         """Test database connection."""
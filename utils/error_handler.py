@@ -1,43 +1,44 @@
 import logging
 from typing import Dict, Any
+import re
 import traceback
 
+# Error categories, matched case-insensitively in a single pass over the message
+_ERROR_RE = re.compile(
+    r"(?P<connection>connection)"
+    r"|(?P<sql>sql|syntax)"
+    r"|(?P<authentication>authentication|access denied)"
+    r"|(?P<network>network|timeout)"
+    r"|(?P<api>api|groq)"
+    r"|(?P<data>dataframe|pandas)"
+    r"|(?P<visualization>chart|plot)",
+    re.IGNORECASE
+)
+
+# User-facing message per category, in priority order
+_ERROR_MESSAGES = {
+    "connection": "❌ Database connection failed. Please check your connection settings.",
+    "sql": "❌ SQL Error: {error}",
+    "authentication": "❌ Authentication failed. Please check your username and password.",
+    "network": "❌ Network error. Please check your internet connection.",
+    "api": "❌ AI service error. Please check your API key and try again.",
+    "data": "❌ Data processing error. Please check your data format.",
+    "visualization": "❌ Chart generation error. The data might not be suitable for visualization."
+}
+
 class ErrorHandler:
     """Handle and format errors for user-friendly display."""
     
     @staticmethod
     def handle_error(error: Exception) -> str:
         """Handle different types of errors and return user-friendly messages."""
-        error_type = type(error).__name__
         error_message = str(error)
         
-        # Database connection errors
-        if "connection" in error_message.lower():
-            return "❌ Database connection failed. Please check your connection settings."
-        
-        # SQL errors
-        if "sql" in error_message.lower() or "syntax" in error_message.lower():
-            return f"❌ SQL Error: {error_message}"
-        
-        # Authentication errors
-        if "authentication" in error_message.lower() or "access denied" in error_message.lower():
-            return "❌ Authentication failed. Please check your username and password."
-        
-        # Network errors
-        if "network" in error_message.lower() or "timeout" in error_message.lower():
-            return "❌ Network error. Please check your internet connection."
-        
-        # API errors
-        if "api" in error_message.lower() or "groq" in error_message.lower():
-            return "❌ AI service error. Please check your API key and try again."
-        
-        # Data processing errors
-        if "dataframe" in error_message.lower() or "pandas" in error_message.lower():
-            return "❌ Data processing error. Please check your data format."
-        
-        # Visualization errors
-        if "chart" in error_message.lower() or "plot" in error_message.lower():
-            return "❌ Chart generation error. The data might not be suitable for visualization."
+        # One scan finds every category mentioned; the earliest-listed category wins
+        categories = {match.lastgroup for match in _ERROR_RE.finditer(error_message)}
+        for category, message in _ERROR_MESSAGES.items():
+            if category in categories:
+                return message.format(error=error_message)
         
         # Generic errors
         return f"❌ Error: {error_message}"
@@ -1,5 +1,9 @@
+import atexit
 import logging
 import os
+import queue
+import threading
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 from datetime import datetime
 from typing import Optional
 
@@ -7,24 +11,37 @@ class Logger:
     """Centralized logging utility."""
     
     _logger = None
+    _listener = None
+    _lock = threading.Lock()
+    
+    # Log files roll over at this size, keeping this many backups
+    LOG_MAX_BYTES = 10 << 20
+    LOG_BACKUP_COUNT = 5
     
     @classmethod
     def get_logger(cls, name: str = "dataviz_chatbot") -> logging.Logger:
         """Get or create logger instance."""
         if cls._logger is None:
-            cls._logger = logging.getLogger(name)
-            cls._setup_logger()
+            with cls._lock:
+                if cls._logger is None:
+                    logger = logging.getLogger(name)
+                    # A re-imported module must not stack a second set of handlers
+                    if not logger.handlers:
+                        cls._setup_logger(logger)
+                    cls._logger = logger
         return cls._logger
     
     @classmethod
-    def _setup_logger(cls):
+    def _setup_logger(cls, logger: logging.Logger):
         """Setup logger configuration."""
         # Create logs directory if it doesn't exist
         log_dir = "logs"
         os.makedirs(log_dir, exist_ok=True)
         
         # Set log level
-        cls._logger.setLevel(logging.INFO)
+        logger.setLevel(logging.INFO)
+        # Records are handled here only, not again by the root logger
+        logger.propagate = False
         
         # Create formatter
         formatter = logging.Formatter(
@@ -33,7 +50,9 @@ class Logger:
         
         # File handler
         log_file = os.path.join(log_dir, f"app_{datetime.now().strftime('%Y%m%d')}.log")
-        file_handler = logging.FileHandler(log_file)
+        file_handler = RotatingFileHandler(
+            log_file, maxBytes=cls.LOG_MAX_BYTES, backupCount=cls.LOG_BACKUP_COUNT
+        )
         file_handler.setLevel(logging.INFO)
         file_handler.setFormatter(formatter)
         
@@ -42,9 +61,13 @@ class Logger:
         console_handler.setLevel(logging.WARNING)
         console_handler.setFormatter(formatter)
         
-        # Add handlers
-        cls._logger.addHandler(file_handler)
-        cls._logger.addHandler(console_handler)
+        # Callers only enqueue records; a background thread does the writing
+        log_queue = queue.Queue(-1)
+        cls._listener = QueueListener(log_queue, file_handler, console_handler, respect_handler_level=True)
+        cls._listener.start()
+        atexit.register(cls._listener.stop)
+        
+        logger.addHandler(QueueHandler(log_queue))
     
     @classmethod
     def log_info(cls, message: str):
@@ -1,28 +1,96 @@
 import pandas as pd
 import pymysql
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
 from sqlalchemy.exc import SQLAlchemyError
 import logging
-from typing import List, Dict, Optional
-from .base_connector import BaseConnector
+from typing import List, Dict, Iterable, Optional
+from urllib.parse import quote
+from .base_connector import BaseConnector, get_shared_engine
+
+try:
+    import connectorx as cx
+except ImportError:  # optional fast path
+    cx = None
+
+# Catalog queries take bound parameters, so MySQL can reuse the prepared statement
+_SCHEMA_SQL = text("""
+    SELECT 
+        TABLE_NAME,
+        COLUMN_NAME,
+        DATA_TYPE,
+        IS_NULLABLE,
+        COLUMN_DEFAULT,
+        COLUMN_KEY,
+        EXTRA,
+        CHARACTER_MAXIMUM_LENGTH,
+        NUMERIC_PRECISION,
+        NUMERIC_SCALE
+    FROM INFORMATION_SCHEMA.COLUMNS 
+    WHERE TABLE_SCHEMA = :db
+    ORDER BY TABLE_NAME, ORDINAL_POSITION
+""")
+
+_COLUMN_INFO_SQL = text("""
+    SELECT 
+        COLUMN_NAME as column_name,
+        DATA_TYPE as data_type,
+        IS_NULLABLE as is_nullable,
+        COLUMN_DEFAULT as column_default,
+        CHARACTER_MAXIMUM_LENGTH as character_maximum_length,
+        NUMERIC_PRECISION as numeric_precision,
+        NUMERIC_SCALE as numeric_scale,
+        COLUMN_KEY as column_key,
+        EXTRA as extra
+    FROM INFORMATION_SCHEMA.COLUMNS 
+    WHERE TABLE_SCHEMA = :db 
+    AND TABLE_NAME = :tbl
+    ORDER BY ORDINAL_POSITION
+""")
 
 class MySQLConnector(BaseConnector):
     """MySQL database connector with optimized queries and error handling."""
     
+    db_type = "mysql"
+    
+    # Connection pool shared by every query issued through this connector
+    POOL_SIZE = 10
+    MAX_OVERFLOW = 20
+    # Seconds before a pooled connection is replaced, ahead of MySQL's wait_timeout
+    POOL_RECYCLE = 1800
+    CONNECT_ARGS = {"charset": "utf8mb4", "connect_timeout": 10, "read_timeout": 30}
+    
+    # INFORMATION_SCHEMA rows streamed and formatted per batch
+    SCHEMA_CHUNK_SIZE = 1000
+    
+    # Suffixes for COLUMN_KEY values in schema info
+    KEY_SUFFIXES = {"PRI": " (PK)", "MUL": " (FK)", "UNI": " (UNIQUE)"}
+    
     def __init__(self, host: str, port: int, database: str, username: str, password: str):
+        super().__init__()
         self.host = host
         self.port = port
         self.database = database
         self.username = username
         self.password = password
         self.connection_string = f"mysql+pymysql://{username}:{password}@{host}:{port}/{database}"
+        self.cx_uri = f"mysql://{quote(username, safe='')}:{quote(password, safe='')}@{host}:{port}/{database}"
         self.engine = None
         self._connect()
     
     def _connect(self):
         """Establish database connection."""
         try:
-            self.engine = create_engine(self.connection_string, pool_pre_ping=True)
+            # Connectors for the same database share one pool across sessions and reruns
+            self.engine = get_shared_engine(
+                self.connection_string,
+                pool_size=self.POOL_SIZE,
+                max_overflow=self.MAX_OVERFLOW,
+                pool_recycle=self.POOL_RECYCLE,
+                pool_pre_ping=True,
+                # Reuse the most recently returned connection so idle ones can expire
+                pool_use_lifo=True,
+                connect_args=self.CONNECT_ARGS
+            )
             logging.info(f"Connected to MySQL database: {self.database}")
         except Exception as e:
             logging.error(f"Failed to connect to MySQL: {str(e)}")
@@ -47,16 +115,12 @@ class MySQLConnector(BaseConnector):
                 raise ValueError("Empty query provided")
             
             # Security check - prevent dangerous operations
-            dangerous_keywords = ['DROP', 'DELETE', 'UPDATE', 'INSERT', 'ALTER', 'CREATE', 'TRUNCATE']
-            query_upper = query.upper()
+            self._check_query_safety(query)
             
-            for keyword in dangerous_keywords:
-                if keyword in query_upper and not query_upper.startswith('SELECT'):
-                    raise ValueError(f"Dangerous operation detected: {keyword}")
-            
-            # Execute query with timeout
-            with self.engine.connect() as conn:
-                result = pd.read_sql_query(text(query), conn)
+            # Execute query, preferring ConnectorX's columnar reader
+            result = self._read_with_connectorx(query)
+            if result is None:
+                result = self._read_sql_streamed(query)
                 
             logging.info(f"Query executed successfully: {query[:100]}...")
             return result
@@ -68,14 +132,30 @@ class MySQLConnector(BaseConnector):
             logging.error(f"Query execution failed: {str(e)}")
             raise
     
+    def _read_with_connectorx(self, query: str) -> Optional[pd.DataFrame]:
+        """Read query results through ConnectorX into Arrow, or None if unavailable."""
+        if cx is None:
+            return None
+        try:
+            # Arrow buffers are released column by column as the frame is built
+            table = cx.read_sql(self.cx_uri, query, return_type="arrow")
+            return table.to_pandas(split_blocks=True, self_destruct=True, types_mapper=self._arrow_types_mapper())
+        except BaseException as e:
+            # Unsupported types and connection failures fall back; SQL errors would just fail again in SQLAlchemy
+            if not self._connectorx_can_fall_back(e):
+                raise
+            logging.debug(f"ConnectorX read failed, falling back to SQLAlchemy: {str(e)}")
+            return None
+    
     def get_tables(self) -> List[str]:
         """Get list of all tables in the database."""
         try:
             query = f"SHOW TABLES;"
-            result = self.execute_query(query)
             # MySQL returns tables in a column named 'Tables_in_{database_name}'
             table_column = f"Tables_in_{self.database}"
-            return result[table_column].tolist()
+            return list(self._cached_metadata(
+                ("tables",), lambda: tuple(self.execute_query(query)[table_column])
+            ))
         except Exception as e:
             logging.error(f"Failed to get tables: {str(e)}")
             return []
@@ -83,70 +163,74 @@ class MySQLConnector(BaseConnector):
     def get_schema_info(self) -> str:
         """Get comprehensive schema information."""
         try:
-            query = f"""
-            SELECT 
-                TABLE_NAME,
-                COLUMN_NAME,
-                DATA_TYPE,
-                IS_NULLABLE,
-                COLUMN_DEFAULT,
-                COLUMN_KEY,
-                EXTRA,
-                CHARACTER_MAXIMUM_LENGTH,
-                NUMERIC_PRECISION,
-                NUMERIC_SCALE
-            FROM INFORMATION_SCHEMA.COLUMNS 
-            WHERE TABLE_SCHEMA = '{self.database}'
-            ORDER BY TABLE_NAME, ORDINAL_POSITION;
-            """
-            
-            result = self.execute_query(query)
-            
-            # Format schema info
-            schema_info = ""
-            current_table = None
-            
-            for _, row in result.iterrows():
-                if current_table != row['TABLE_NAME']:
-                    if current_table is not None:
-                        schema_info += "\n"
-                    current_table = row['TABLE_NAME']
-                    schema_info += f"Table: {current_table}\n"
-                
-                key_info = ""
-                if row['COLUMN_KEY'] == 'PRI':
-                    key_info = " (PK)"
-                elif row['COLUMN_KEY'] == 'MUL':
-                    key_info = " (FK)"
-                elif row['COLUMN_KEY'] == 'UNI':
-                    key_info = " (UNIQUE)"
-                
-                nullable = "NULL" if row['IS_NULLABLE'] == 'YES' else "NOT NULL"
-                default = f" DEFAULT {row['COLUMN_DEFAULT']}" if row['COLUMN_DEFAULT'] else ""
-                extra = f" {row['EXTRA']}" if row['EXTRA'] else ""
-                
-                data_type = row['DATA_TYPE']
-                if row['CHARACTER_MAXIMUM_LENGTH']:
-                    data_type += f"({row['CHARACTER_MAXIMUM_LENGTH']})"
-                elif row['NUMERIC_PRECISION']:
-                    if row['NUMERIC_SCALE']:
-                        data_type += f"({row['NUMERIC_PRECISION']},{row['NUMERIC_SCALE']})"
-                    else:
-                        data_type += f"({row['NUMERIC_PRECISION']})"
-                
-                schema_info += f"  - {row['COLUMN_NAME']}: {data_type}{key_info} {nullable}{default}{extra}\n"
-            
-            return schema_info
+            return self._cached_metadata(("schema",), self._read_schema_info)
             
         except Exception as e:
             logging.error(f"Failed to get schema info: {str(e)}")
             return "Schema information unavailable"
     
+    def _read_schema_info(self) -> str:
+        """Read and format the schema, streaming the catalog from a server-side cursor."""
+        with self.engine.connect().execution_options(stream_results=True) as conn:
+            chunks = pd.read_sql_query(_SCHEMA_SQL, conn, params={"db": self.database},
+                                       chunksize=self.SCHEMA_CHUNK_SIZE)
+            return self._format_schema(chunks)
+    
+    @classmethod
+    def _format_schema(cls, chunks: Iterable[pd.DataFrame]) -> str:
+        """Format INFORMATION_SCHEMA.COLUMNS rows, read in chunks ordered by table."""
+        parts = []
+        current_table = None
+        
+        for chunk in chunks:
+            lines = cls._format_column_lines(chunk)
+            for table, table_lines in lines.groupby(chunk["TABLE_NAME"], sort=False):
+                # A table can continue from the previous chunk
+                if table != current_table:
+                    if current_table is not None:
+                        parts.append("\n")
+                    parts.append(f"Table: {table}\n")
+                    current_table = table
+                parts.append("".join(table_lines))
+        
+        return "".join(parts)
+    
+    @classmethod
+    def _format_column_lines(cls, result: pd.DataFrame) -> pd.Series:
+        """Build the schema line for every column row at once."""
+        def numbers(column: str) -> pd.Series:
+            # Integer text for set, non-zero values; NULL and 0 become ""
+            values = pd.to_numeric(result[column], errors="coerce")
+            values = values.where(values != 0)
+            return values.astype("Int64").astype(str).where(values.notna(), "")
+        
+        def optional_text(column: str, prefix: str) -> pd.Series:
+            values = result[column]
+            present = values.notna() & (values.astype(str) != "")
+            return (prefix + values.astype(str)).where(present, "")
+        
+        length, precision, scale = (numbers(column) for column in
+                                    ("CHARACTER_MAXIMUM_LENGTH", "NUMERIC_PRECISION", "NUMERIC_SCALE"))
+        size = ("(" + length + ")").where(length != "", "")
+        size = size.where(length != "", ("(" + precision + ("," + scale).where(scale != "", "") + ")")
+                          .where(precision != "", ""))
+        
+        key_info = result["COLUMN_KEY"].map(cls.KEY_SUFFIXES).fillna("")
+        nullable = (result["IS_NULLABLE"] == "YES").map({True: "NULL", False: "NOT NULL"})
+        
+        return ("  - " + result["COLUMN_NAME"].astype(str) + ": " + result["DATA_TYPE"].astype(str) + size
+                + key_info + " " + nullable + optional_text("COLUMN_DEFAULT", " DEFAULT ")
+                + optional_text("EXTRA", " ") + "\n")
+    
     def get_table_sample(self, table_name: str, limit: int = 5) -> pd.DataFrame:
         """Get sample data from a table."""
         try:
-            query = f"SELECT * FROM {table_name} LIMIT {limit};"
-            return self.execute_query(query)
+            # Identifiers cannot be bound, so only known table names are interpolated
+            if table_name not in self.get_tables():
+                raise ValueError(f"Unknown table: {table_name}")
+            quoted_name = table_name.replace("`", "``")
+            query = text(f"SELECT * FROM `{quoted_name}` LIMIT :limit")
+            return self._read_catalog(query, limit=int(limit))
         except Exception as e:
             logging.error(f"Failed to get table sample: {str(e)}")
             return pd.DataFrame()
@@ -154,30 +238,16 @@ class MySQLConnector(BaseConnector):
     def get_column_info(self, table_name: str) -> List[Dict]:
         """Get detailed column information for a table."""
         try:
-            query = f"""
-            SELECT 
-                COLUMN_NAME as column_name,
-                DATA_TYPE as data_type,
-                IS_NULLABLE as is_nullable,
-                COLUMN_DEFAULT as column_default,
-                CHARACTER_MAXIMUM_LENGTH as character_maximum_length,
-                NUMERIC_PRECISION as numeric_precision,
-                NUMERIC_SCALE as numeric_scale,
-                COLUMN_KEY as column_key,
-                EXTRA as extra
-            FROM INFORMATION_SCHEMA.COLUMNS 
-            WHERE TABLE_SCHEMA = '{self.database}' 
-            AND TABLE_NAME = '{table_name}'
-            ORDER BY ORDINAL_POSITION;
-            """
-            result = self.execute_query(query)
-            return result.to_dict('records')
+            return list(self._cached_metadata(
+                ("columns", table_name),
+                lambda: tuple(self._read_catalog(_COLUMN_INFO_SQL, db=self.database, tbl=table_name).to_dict('records'))
+            ))
         except Exception as e:
             logging.error(f"Failed to get column info: {str(e)}")
             return []
     
     def close(self):
         """Close database connection."""
-        if self.engine:
-            self.engine.dispose()
-            logging.info("MySQL connection closed")
\ No newline at end of file
+        # The shared engine stays open for other connectors and is disposed at exit
+        self.engine = None
+        logging.info("MySQL connection closed")
\ No newline at end of file
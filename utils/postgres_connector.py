@@ -1,28 +1,78 @@
 import pandas as pd
 import psycopg2
-from sqlalchemy import create_engine, text
+from sqlalchemy import text
 from sqlalchemy.exc import SQLAlchemyError
 import logging
 from typing import List, Dict, Optional
-from .base_connector import BaseConnector
+from urllib.parse import quote
+from .base_connector import BaseConnector, get_shared_engine
+
+try:
+    import connectorx as cx
+except ImportError:  # optional fast path
+    cx = None
+
+# Column details for one table, with the table name bound as :tbl
+_COLUMN_INFO_SQL = text("""
+SELECT 
+    column_name,
+    data_type,
+    is_nullable,
+    column_default,
+    character_maximum_length,
+    numeric_precision,
+    numeric_scale
+FROM information_schema.columns 
+WHERE table_name = :tbl 
+ORDER BY ordinal_position
+""")
+
+# Planner row estimate for a table in the public schema; -1 (or 0 before PG 14) until analyzed
+_ROW_ESTIMATE_SQL = text("""
+SELECT c.reltuples::bigint AS row_count
+FROM pg_class c
+JOIN pg_namespace n ON n.oid = c.relnamespace
+WHERE n.nspname = 'public' AND c.relname = :tbl
+""")
 
 class PostgreSQLConnector(BaseConnector):
     """PostgreSQL database connector with optimized queries and error handling."""
     
-    def __init__(self, host: str, port: int, database: str, username: str, password: str):
+    db_type = "postgresql"
+    
+    # Connection pool shared by every query issued through this connector
+    POOL_SIZE = 10
+    MAX_OVERFLOW = 20
+    # Seconds before a pooled connection is replaced, so idle ones dropped by proxies are not reused
+    POOL_RECYCLE = 1800
+    
+    def __init__(self, host: str, port: int, database: str, username: str, password: str,
+                 sslmode: str = "prefer"):
+        super().__init__()
         self.host = host
         self.port = port
         self.database = database
         self.username = username
         self.password = password
-        self.connection_string = f"postgresql://{username}:{password}@{host}:{port}/{database}"
+        self.sslmode = sslmode
+        self.connection_string = f"postgresql://{username}:{password}@{host}:{port}/{database}?sslmode={sslmode}"
+        # ConnectorX connects without TLS unless told otherwise; match psycopg2's default of "prefer"
+        self.cx_uri = (f"postgresql://{quote(username, safe='')}:{quote(password, safe='')}"
+                       f"@{host}:{port}/{database}?sslmode={sslmode}")
         self.engine = None
         self._connect()
     
     def _connect(self):
         """Establish database connection."""
         try:
-            self.engine = create_engine(self.connection_string, pool_pre_ping=True)
+            # Connectors for the same database share one pool across sessions and reruns
+            self.engine = get_shared_engine(
+                self.connection_string,
+                pool_size=self.POOL_SIZE,
+                max_overflow=self.MAX_OVERFLOW,
+                pool_recycle=self.POOL_RECYCLE,
+                pool_pre_ping=True
+            )
             logging.info(f"Connected to PostgreSQL database: {self.database}")
         except Exception as e:
             logging.error(f"Failed to connect to PostgreSQL: {str(e)}")
@@ -47,16 +97,12 @@ class PostgreSQLConnector(BaseConnector):
                 raise ValueError("Empty query provided")
             
             # Security check - prevent dangerous operations
-            dangerous_keywords = ['DROP', 'DELETE', 'UPDATE', 'INSERT', 'ALTER', 'CREATE', 'TRUNCATE']
-            query_upper = query.upper()
-            
-            for keyword in dangerous_keywords:
-                if keyword in query_upper and not query_upper.startswith('SELECT'):
-                    raise ValueError(f"Dangerous operation detected: {keyword}")
+            self._check_query_safety(query)
             
-            # Execute query with timeout
-            with self.engine.connect() as conn:
-                result = pd.read_sql_query(text(query), conn)
+            # Execute query, preferring ConnectorX's columnar reader
+            result = self._read_with_connectorx(query)
+            if result is None:
+                result = self._read_sql_streamed(query)
                 
             logging.info(f"Query executed successfully: {query[:100]}...")
             return result
@@ -68,6 +114,21 @@ class PostgreSQLConnector(BaseConnector):
             logging.error(f"Query execution failed: {str(e)}")
             raise
     
+    def _read_with_connectorx(self, query: str) -> Optional[pd.DataFrame]:
+        """Read query results through ConnectorX into Arrow, or None if unavailable."""
+        if cx is None:
+            return None
+        try:
+            # Arrow buffers are released column by column as the frame is built
+            table = cx.read_sql(self.cx_uri, query, return_type="arrow")
+            return table.to_pandas(split_blocks=True, self_destruct=True, types_mapper=self._arrow_types_mapper())
+        except BaseException as e:
+            # Unsupported types and connection failures fall back; SQL errors would just fail again in SQLAlchemy
+            if not self._connectorx_can_fall_back(e):
+                raise
+            logging.debug(f"ConnectorX read failed, falling back to SQLAlchemy: {str(e)}")
+            return None
+    
     def get_tables(self) -> List[str]:
         """Get list of all tables in the database."""
         try:
@@ -77,8 +138,9 @@ class PostgreSQLConnector(BaseConnector):
             WHERE table_schema = 'public' 
             ORDER BY table_name;
             """
-            result = self.execute_query(query)
-            return result['table_name'].tolist()
+            return list(self._cached_metadata(
+                ("tables",), lambda: tuple(self.execute_query(query)['table_name'])
+            ))
         except Exception as e:
             logging.error(f"Failed to get tables: {str(e)}")
             return []
@@ -118,36 +180,44 @@ class PostgreSQLConnector(BaseConnector):
             ORDER BY t.table_name, c.ordinal_position;
             """
             
-            result = self.execute_query(query)
-            
-            # Format schema info
-            schema_info = ""
-            current_table = None
-            
-            for _, row in result.iterrows():
-                if current_table != row['table_name']:
-                    if current_table is not None:
-                        schema_info += "\n"
-                    current_table = row['table_name']
-                    schema_info += f"Table: {current_table}\n"
-                
-                key_info = f" ({row['key_type']})" if row['key_type'] else ""
-                nullable = "NULL" if row['is_nullable'] == 'YES' else "NOT NULL"
-                default = f" DEFAULT {row['column_default']}" if row['column_default'] else ""
-                
-                schema_info += f"  - {row['column_name']}: {row['data_type']}{key_info} {nullable}{default}\n"
-            
-            return schema_info
+            return self._cached_metadata(("schema",), lambda: self._format_schema(self.execute_query(query)))
             
         except Exception as e:
             logging.error(f"Failed to get schema info: {str(e)}")
             return "Schema information unavailable"
     
+    @staticmethod
+    def _format_schema(result: pd.DataFrame) -> str:
+        """Format schema query rows, building all column lines at once."""
+        if result.empty:
+            return ""
+        
+        def optional_text(column: str, prefix: str, suffix: str = "") -> pd.Series:
+            values = result[column]
+            present = values.notna() & (values.astype(str) != "")
+            return (prefix + values.astype(str) + suffix).where(present, "")
+        
+        nullable = (result["is_nullable"] == "YES").map({True: "NULL", False: "NOT NULL"})
+        lines = ("  - " + result["column_name"].astype(str) + ": " + result["data_type"].astype(str)
+                 + optional_text("key_type", " (", ")") + " " + nullable
+                 + optional_text("column_default", " DEFAULT ") + "\n")
+        # Tables without columns come back from the LEFT JOIN as one all-null row: header only
+        lines = lines.where(result["column_name"].notna(), "")
+        
+        return "\n".join(
+            f"Table: {table}\n" + "".join(table_lines)
+            for table, table_lines in lines.groupby(result["table_name"], sort=False)
+        )
+    
     def get_table_sample(self, table_name: str, limit: int = 5) -> pd.DataFrame:
         """Get sample data from a table."""
         try:
-            query = f"SELECT * FROM {table_name} LIMIT {limit};"
-            return self.execute_query(query)
+            # Identifiers cannot be bound, so only known table names are interpolated
+            if table_name not in self.get_tables():
+                raise ValueError(f"Unknown table: {table_name}")
+            quoted_name = table_name.replace('"', '""')
+            query = text(f'SELECT * FROM "{quoted_name}" LIMIT :limit')
+            return self._read_catalog(query, limit=int(limit))
         except Exception as e:
             logging.error(f"Failed to get table sample: {str(e)}")
             return pd.DataFrame()
@@ -155,27 +225,57 @@ class PostgreSQLConnector(BaseConnector):
     def get_column_info(self, table_name: str) -> List[Dict]:
         """Get detailed column information for a table."""
         try:
-            query = f"""
-            SELECT 
-                column_name,
-                data_type,
-                is_nullable,
-                column_default,
-                character_maximum_length,
-                numeric_precision,
-                numeric_scale
-            FROM information_schema.columns 
-            WHERE table_name = '{table_name}' 
-            ORDER BY ordinal_position;
-            """
-            result = self.execute_query(query)
-            return result.to_dict('records')
+            return list(self._cached_metadata(
+                ("columns", table_name),
+                lambda: tuple(self._read_catalog(_COLUMN_INFO_SQL, tbl=table_name).to_dict('records'))
+            ))
         except Exception as e:
             logging.error(f"Failed to get column info: {str(e)}")
             return []
     
+    def get_table_stats(self, table_name: str) -> Dict:
+        """Get basic statistics for a table."""
+        try:
+            # Get row count, from the planner's estimate when the table has been analyzed
+            row_count = self._estimated_row_count(table_name)
+            if row_count is None:
+                quoted_name = table_name.replace('"', '""')
+                count_query = text(f'SELECT COUNT(*) AS row_count FROM "{quoted_name}"')
+                row_count = int(self._read_catalog(count_query).iloc[0]['row_count'])
+            
+            # Get column count
+            columns = self.get_column_info(table_name)
+            
+            # Get sample data to analyze
+            sample_data = self.get_table_sample(table_name, 1000)
+            
+            stats = {
+                'row_count': row_count,
+                'column_count': len(columns),
+                'columns': [col['column_name'] for col in columns],
+                'sample_size': len(sample_data)
+            }
+            
+            # Add basic stats for numeric columns
+            numeric_columns = sample_data.select_dtypes(include=['number']).columns
+            if len(numeric_columns) > 0:
+                stats['numeric_columns'] = list(numeric_columns)
+            
+            return stats
+            
+        except Exception as e:
+            logging.error(f"Failed to get table stats: {str(e)}")
+            return {}
+    
+    def _estimated_row_count(self, table_name: str) -> Optional[int]:
+        """Row count from pg_class.reltuples, or None if the table has not been analyzed."""
+        result = self._read_catalog(_ROW_ESTIMATE_SQL, tbl=table_name)
+        if result.empty or result.iloc[0]['row_count'] <= 0:
+            return None
+        return int(result.iloc[0]['row_count'])
+    
     def close(self):
         """Close database connection."""
-        if self.engine:
-            self.engine.dispose()
-            logging.info("PostgreSQL connection closed")
\ No newline at end of file
+        # The shared engine stays open for other connectors and is disposed at exit
+        self.engine = None
+        logging.info("PostgreSQL connection closed")
\ No newline at end of file
@@ -0,0 +1,20 @@
+import re
+from typing import Optional
+
+# Data-modifying statements, matched as whole words so identifiers such as
+# inserted_at or created_by are allowed
+_DANGEROUS_RE = re.compile(r"\b(DROP|DELETE|UPDATE|INSERT|ALTER|CREATE|TRUNCATE)\b", re.IGNORECASE)
+_SELECT_RE = re.compile(r"\s*SELECT\b", re.IGNORECASE)
+
+def starts_with_select(sql: str) -> bool:
+    """Check whether the statement begins with SELECT."""
+    return _SELECT_RE.match(sql) is not None
+
+def find_dangerous_keyword(sql: str) -> Optional[str]:
+    """Return the first data-modifying keyword in the statement, or None."""
+    match = _DANGEROUS_RE.search(sql)
+    return match.group(1).upper() if match else None
+
+def is_safe_select(sql: str) -> bool:
+    """Check that the statement is a SELECT with no data-modifying keyword anywhere."""
+    return starts_with_select(sql) and find_dangerous_keyword(sql) is None
@@ -1,17 +1,35 @@
+import numpy as np
 import pandas as pd
 import sqlite3
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, event, text
 from sqlalchemy.exc import SQLAlchemyError
 import logging
+import re
 import tempfile
 import os
 from typing import List, Dict, Optional, Union
-from .base_connector import BaseConnector
+from .base_connector import BaseConnector, get_shared_engine
 import streamlit as st
 
+try:
+    import connectorx as cx
+except ImportError:  # optional fast path
+    cx = None
+
+# Characters dropped from CSV column names once spaces become underscores
+_NON_WORD_RE = re.compile(r'[^\w]+')
+
 class SQLiteConnector(BaseConnector):
     """SQLite database connector with CSV upload support and optimized queries."""
     
+    db_type = "sqlite"
+    
+    # Rows per executemany batch when loading CSV data
+    INSERT_CHUNK_SIZE = 10_000
+    
+    # Non-null values inspected to decide whether a text column is worth parsing as dates
+    TYPE_SAMPLE_SIZE = 1000
+    
     def __init__(self, database_path: Optional[str] = None, uploaded_file=None):
         """
         Initialize SQLite connector.
@@ -20,10 +38,12 @@ class SQLiteConnector(BaseConnector):
             database_path: Path to SQLite database file (for local files)
             uploaded_file: Streamlit uploaded file object (for uploaded .db files)
         """
+        super().__init__()
         self.database_path = database_path
         self.uploaded_file = uploaded_file
         self.engine = None
         self.temp_db_path = None
+        self.cx_uri = None
         self._connect()
     
     def _connect(self):
@@ -41,7 +61,20 @@ class SQLiteConnector(BaseConnector):
                 self.temp_db_path = tempfile.NamedTemporaryFile(delete=False, suffix='.db').name
                 connection_string = f"sqlite:///{self.temp_db_path}"
             
-            self.engine = create_engine(connection_string, pool_pre_ping=True)
+            # ConnectorX needs an absolute path
+            self.cx_uri = f"sqlite://{os.path.abspath(connection_string[len('sqlite:///'):])}"
+            
+            if self.temp_db_path:
+                # Temporary databases belong to this connector and are removed on close
+                self.engine = create_engine(connection_string, pool_pre_ping=True)
+                self._register_listeners(self.engine)
+            else:
+                # Connectors for the same database file share one pool
+                self.engine = get_shared_engine(
+                    connection_string,
+                    on_create=self._register_listeners,
+                    pool_pre_ping=True
+                )
             logging.info(f"Connected to SQLite database")
             
         except Exception as e:
@@ -49,6 +82,44 @@ class SQLiteConnector(BaseConnector):
             raise
 
     
+    def _register_listeners(self, engine):
+        """Attach connection tuning and working transaction control to an engine."""
+        event.listen(engine, "connect", self._configure_connection)
+        if self._is_scratch_database():
+            event.listen(engine, "connect", self._configure_scratch_connection)
+        
+        # pysqlite defers its own BEGIN and breaks SAVEPOINT; SQLAlchemy emits BEGIN instead
+        event.listen(engine, "connect", self._disable_driver_transactions)
+        event.listen(engine, "begin", self._begin_transaction)
+    
+    @staticmethod
+    def _disable_driver_transactions(dbapi_connection, connection_record):
+        """Stop pysqlite from opening and committing transactions on its own."""
+        dbapi_connection.isolation_level = None
+    
+    @staticmethod
+    def _begin_transaction(conn):
+        """Open the transaction SQLAlchemy starts, so SAVEPOINTs nest inside it."""
+        conn.exec_driver_sql("BEGIN")
+    
+    @staticmethod
+    def _configure_scratch_connection(dbapi_connection, connection_record):
+        """Relax durability on a freshly created scratch database; loads can be repeated."""
+        cursor = dbapi_connection.cursor()
+        # An in-memory journal keeps ROLLBACK (and savepoints) working, unlike journal_mode=OFF
+        cursor.execute("PRAGMA journal_mode = MEMORY")
+        cursor.execute("PRAGMA synchronous = OFF")
+        cursor.close()
+    
+    @staticmethod
+    def _configure_connection(dbapi_connection, connection_record):
+        """Tune each new SQLite connection for read-heavy analytical queries."""
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA mmap_size = 1073741824")  # serve reads from the OS page cache
+        cursor.execute("PRAGMA cache_size = -262144")    # up to 256 MiB page cache
+        cursor.execute("PRAGMA temp_store = MEMORY")
+        cursor.close()
+    
     def _create_temp_db_from_upload(self) -> str:
         """Create temporary database file from uploaded file."""
         try:
@@ -85,16 +156,12 @@ class SQLiteConnector(BaseConnector):
                 raise ValueError("Empty query provided")
             
             # Security check - prevent dangerous operations
-            dangerous_keywords = ['DROP', 'DELETE', 'UPDATE', 'INSERT', 'ALTER', 'CREATE', 'TRUNCATE']
-            query_upper = query.upper()
+            self._check_query_safety(query)
             
-            for keyword in dangerous_keywords:
-                if keyword in query_upper and not query_upper.startswith('SELECT'):
-                    raise ValueError(f"Dangerous operation detected: {keyword}")
-            
-            # Execute query
-            with self.engine.connect() as conn:
-                result = pd.read_sql_query(text(query), conn)
+            # Execute query, preferring ConnectorX's columnar reader
+            result = self._read_with_connectorx(query)
+            if result is None:
+                result = self._read_sql_streamed(query)
                 
             logging.info(f"Query executed successfully: {query[:100]}...")
             return result
@@ -106,12 +173,26 @@ class SQLiteConnector(BaseConnector):
             logging.error(f"Query execution failed: {str(e)}")
             raise
     
+    def _read_with_connectorx(self, query: str) -> Optional[pd.DataFrame]:
+        """Read query results through ConnectorX into Arrow, or None if unavailable."""
+        if cx is None:
+            return None
+        try:
+            # Arrow buffers are released column by column as the frame is built
+            table = cx.read_sql(self.cx_uri, query, return_type="arrow")
+            return table.to_pandas(split_blocks=True, self_destruct=True, types_mapper=self._arrow_types_mapper())
+        except BaseException as e:
+            # Only unsupported types fall back; SQL errors would just fail again in SQLAlchemy
+            if not self._connectorx_can_fall_back(e):
+                raise
+            logging.debug(f"ConnectorX read failed, falling back to SQLAlchemy: {str(e)}")
+            return None
+    
     def get_tables(self) -> List[str]:
         """Get list of all tables in the database."""
         try:
             query = "SELECT name FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%';"
-            result = self.execute_query(query)
-            return result['name'].tolist()
+            return list(self._cached_metadata(("tables",), lambda: tuple(self.execute_query(query)['name'])))
         except Exception as e:
             logging.error(f"Failed to get tables: {str(e)}")
             return []
@@ -119,48 +200,54 @@ class SQLiteConnector(BaseConnector):
     def get_schema_info(self) -> str:
         """Get comprehensive schema information."""
         try:
-            tables = self.get_tables()
-            
-            if not tables:
-                return "No tables found in the database."
-            
-            schema_info = ""
-            
-            for table in tables:
-                schema_info += f"Table: {table}\n"
-                
-                # Quote table name to handle special characters
-                quoted_table = f'"{table}"'
-                query = f"PRAGMA table_info({quoted_table});"
-                
-                try:
-                    result = self.execute_query(query)
-                    
-                    for _, row in result.iterrows():
-                        column_name = row['name']
-                        data_type = row['type']
-                        not_null = "NOT NULL" if row['notnull'] else "NULL"
-                        default_value = f" DEFAULT {row['dflt_value']}" if row['dflt_value'] else ""
-                        primary_key = " (PK)" if row['pk'] else ""
-                        
-                        schema_info += f"  - {column_name}: {data_type}{primary_key} {not_null}{default_value}\n"
-                    
-                except Exception as table_error:
-                    schema_info += f"  Error retrieving info for table {table}: {str(table_error)}\n"
-                
-                schema_info += "\n"
-            
-            return schema_info
-            
+            return self._cached_metadata(("schema",), self._read_schema_info)
         except Exception as e:
             return f"Schema information unavailable: {str(e)}"
+    
+    def _read_schema_info(self) -> str:
+        """Build the schema description from table_info for every table in one query."""
+        query = """
+        SELECT m.name AS table_name, p.name, p.type, p."notnull", p.dflt_value, p.pk
+        FROM sqlite_master m
+        JOIN pragma_table_info(m.name) p
+        WHERE m.type = 'table' AND m.name NOT LIKE 'sqlite_%'
+        ORDER BY m.rowid, p.cid;
+        """
+        result = self.execute_query(query)
+        
+        if result.empty:
+            return "No tables found in the database."
+        
+        lines = self._format_columns(result)
+        return "".join(
+            f"Table: {table}\n" + "".join(table_lines) + "\n"
+            for table, table_lines in lines.groupby(result['table_name'], sort=False)
+        )
+    
+    @staticmethod
+    def _format_columns(result: pd.DataFrame) -> pd.Series:
+        """Build the schema line for every PRAGMA table_info row at once."""
+        if result.empty:
+            return pd.Series(dtype=object)
+        
+        defaults = result['dflt_value']
+        has_default = defaults.notna() & (defaults.astype(str) != "")
+        
+        return ("  - " + result['name'].astype(str) + ": " + result['type'].astype(str)
+                + result['pk'].astype(bool).map({True: " (PK)", False: ""})
+                + result['notnull'].astype(bool).map({True: " NOT NULL", False: " NULL"})
+                + (" DEFAULT " + defaults.astype(str)).where(has_default, "") + "\n")
 
     
     def get_table_sample(self, table_name: str, limit: int = 5) -> pd.DataFrame:
         """Get sample data from a table."""
         try:
-            query = f"SELECT * FROM {table_name} LIMIT {limit};"
-            return self.execute_query(query)
+            # Identifiers cannot be bound, so only known table names are interpolated
+            if table_name not in self.get_tables():
+                raise ValueError(f"Unknown table: {table_name}")
+            quoted_name = table_name.replace('"', '""')
+            query = text(f'SELECT * FROM "{quoted_name}" LIMIT :limit')
+            return self._read_catalog(query, limit=int(limit))
         except Exception as e:
             logging.error(f"Failed to get table sample: {str(e)}")
             return pd.DataFrame()
@@ -168,43 +255,36 @@ class SQLiteConnector(BaseConnector):
     def get_column_info(self, table_name: str) -> List[Dict]:
         """Get detailed column information for a table."""
         try:
-            query = f"PRAGMA table_info({table_name});"
-            result = self.execute_query(query)
-            
-            columns = []
-            for _, row in result.iterrows():
-                columns.append({
-                    'column_name': row['name'],
-                    'data_type': row['type'],
-                    'is_nullable': 'YES' if not row['notnull'] else 'NO',
-                    'column_default': row['dflt_value'],
-                    'is_primary_key': bool(row['pk']),
-                    'position': row['cid']
-                })
-            
-            return columns
+            return list(self._cached_metadata(("columns", table_name), lambda: self._read_column_info(table_name)))
             
         except Exception as e:
             logging.error(f"Failed to get column info: {str(e)}")
             return []
     
+    def _read_column_info(self, table_name: str) -> tuple:
+        """Read column details for a table from PRAGMA table_info."""
+        result = self._read_catalog(text("SELECT * FROM pragma_table_info(:tbl)"), tbl=table_name)
+        
+        columns = pd.DataFrame({
+            'column_name': result['name'],
+            'data_type': result['type'],
+            'is_nullable': result['notnull'].astype(bool).map({True: 'NO', False: 'YES'}),
+            'column_default': result['dflt_value'],
+            'is_primary_key': result['pk'].astype(bool),
+            'position': result['cid']
+        })
+        
+        return tuple(columns.to_dict('records'))
+    
     def create_table_from_csv(self, csv_file, table_name: str) -> bool:
         """Create a table from uploaded CSV file."""
         try:
-            # Read CSV file
-            df = pd.read_csv(csv_file)
-            
-            # Clean column names (replace spaces with underscores, remove special characters)
-            df.columns = df.columns.str.strip().str.replace(' ', '_').str.replace('[^\w]', '', regex=True)
-            
-            # Remove any empty rows
-            df = df.dropna(how='all')
-            
-            # Convert data types intelligently
-            df = self._optimize_datatypes(df)
+            df = self._read_csv_for_table(csv_file)
             
-            # Create table in database
-            df.to_sql(table_name, self.engine, index=False, if_exists='replace')
+            # Create table in database, inserting batches inside one transaction
+            with self.engine.begin() as conn:
+                self._load_dataframe(conn, df, table_name)
+            self.invalidate_metadata()
             
             logging.info(f"Created table '{table_name}' with {len(df)} rows and {len(df.columns)} columns")
             return True
@@ -213,6 +293,83 @@ class SQLiteConnector(BaseConnector):
             logging.error(f"Failed to create table from CSV: {str(e)}")
             return False
     
+    def bulk_create_tables_from_csv(self, csv_files: List, progress_callback=None) -> int:
+        """
+        Create one table per uploaded CSV file inside a single transaction, with a savepoint per file.
+        
+        Args:
+            csv_files: Uploaded CSV file objects; table names come from the file names
+            progress_callback: Optional callable receiving (files_done, total_files)
+            
+        Returns:
+            Number of tables created successfully
+        """
+        success_count = 0
+        total_files = len(csv_files)
+        
+        with self.engine.begin() as conn:
+            for i, csv_file in enumerate(csv_files, 1):
+                table_name = os.path.splitext(csv_file.name)[0]
+                try:
+                    # A savepoint per file, so a failure part-way through rolls back only that table
+                    with conn.begin_nested():
+                        df = self._read_csv_for_table(csv_file)
+                        self._load_dataframe(conn, df, table_name)
+                    success_count += 1
+                    logging.info(f"Created table '{table_name}' with {len(df)} rows and {len(df.columns)} columns")
+                except Exception as e:
+                    logging.error(f"Failed to create table '{table_name}' from CSV: {str(e)}")
+                
+                if progress_callback:
+                    progress_callback(i, total_files)
+        
+        self.invalidate_metadata()
+        return success_count
+    
+    def _load_dataframe(self, conn, df: pd.DataFrame, table_name: str):
+        """Replace table_name with the rows of df, inserting through the driver's executemany."""
+        # pandas creates the table so column types match its SQLAlchemy mapping
+        df.head(0).to_sql(table_name, conn, index=False, if_exists='replace')
+        
+        # Rows bypass SQLAlchemy's per-parameter processing; values are converted per chunk instead
+        quoted_name = table_name.replace('"', '""')
+        quoted_columns = ", ".join('"' + str(column).replace('"', '""') + '"' for column in df.columns)
+        placeholders = ", ".join("?" * len(df.columns))
+        insert_sql = f'INSERT INTO "{quoted_name}" ({quoted_columns}) VALUES ({placeholders})'
+        datetime_columns = [column for column, dtype in df.dtypes.items() if dtype.kind == 'M']
+        
+        for start in range(0, len(df), self.INSERT_CHUNK_SIZE):
+            chunk = df.iloc[start:start + self.INSERT_CHUNK_SIZE]
+            if datetime_columns:
+                # Same text format SQLAlchemy's SQLite DATETIME type stores
+                chunk = chunk.assign(**{
+                    column: chunk[column].dt.strftime('%Y-%m-%d %H:%M:%S.%f') for column in datetime_columns
+                })
+            rows = chunk.astype(object).where(chunk.notna(), None)
+            conn.exec_driver_sql(insert_sql, list(rows.itertuples(index=False, name=None)))
+    
+    def _is_scratch_database(self) -> bool:
+        """Check whether this connector owns a fresh temporary database."""
+        return self.temp_db_path is not None and self.uploaded_file is None and self.database_path is None
+    
+    def _read_csv_for_table(self, csv_file) -> pd.DataFrame:
+        """Read a CSV file and clean it up for loading into a table."""
+        # Prefer the multithreaded pyarrow parser, fall back to the C parser
+        try:
+            df = pd.read_csv(csv_file, engine='pyarrow')
+        except (ImportError, ValueError):
+            csv_file.seek(0)
+            df = pd.read_csv(csv_file)
+        
+        # Clean column names (replace spaces with underscores, remove special characters)
+        df.columns = [_NON_WORD_RE.sub('', str(name).strip().replace(' ', '_')) for name in df.columns]
+        
+        # Remove any empty rows
+        df = df.dropna(how='all')
+        
+        # Convert data types intelligently
+        return self._optimize_datatypes(df)
+    
     def _optimize_datatypes(self, df: pd.DataFrame) -> pd.DataFrame:
         """Optimize data types for better performance."""
         try:
@@ -225,13 +382,15 @@ class SQLiteConnector(BaseConnector):
                 if df[column].dtype == 'object':
                     # Try to convert to numeric
                     numeric_series = pd.to_numeric(df[column], errors='coerce')
-                    if not numeric_series.isna().all():
+                    parsed = numeric_series.notna()
+                    if parsed.any():
                         # Check if it's integer or float
-                        if numeric_series.notna().all() and (numeric_series % 1 == 0).all():
+                        values = numeric_series.to_numpy()
+                        if parsed.all() and np.array_equal(values, np.trunc(values)) and np.isfinite(values).all():
                             df[column] = numeric_series.astype('Int64')  # Nullable integer
                         else:
                             df[column] = numeric_series
-                    else:
+                    elif self._may_hold_dates(df[column]):
                         # Try to convert to datetime
                         try:
                             datetime_series = pd.to_datetime(df[column], errors='coerce')
@@ -246,12 +405,20 @@ class SQLiteConnector(BaseConnector):
             logging.error(f"Failed to optimize datatypes: {str(e)}")
             return df
     
+    def _may_hold_dates(self, series: pd.Series) -> bool:
+        """Check a sample of a text column for digits before attempting a datetime parse."""
+        sample = series.dropna().head(self.TYPE_SAMPLE_SIZE).astype(str)
+        return bool(sample.str.contains(r'\d', regex=True).any())
+    
     def get_table_stats(self, table_name: str) -> Dict:
         """Get basic statistics for a table."""
         try:
-            # Get row count
-            count_query = f"SELECT COUNT(*) as row_count FROM {table_name};"
-            row_count = self.execute_query(count_query).iloc[0]['row_count']
+            # Get row count, from ANALYZE statistics when available
+            row_count = self._estimated_row_count(table_name)
+            if row_count is None:
+                quoted_name = table_name.replace('"', '""')
+                count_query = text(f'SELECT COUNT(*) AS row_count FROM "{quoted_name}"')
+                row_count = int(self._read_catalog(count_query).iloc[0]['row_count'])
             
             # Get column count
             columns = self.get_column_info(table_name)
@@ -278,11 +445,27 @@ class SQLiteConnector(BaseConnector):
             logging.error(f"Failed to get table stats: {str(e)}")
             return {}
     
+    def _estimated_row_count(self, table_name: str) -> Optional[int]:
+        """Row count recorded in sqlite_stat1 by the last ANALYZE, or None if there is none."""
+        try:
+            # Each entry starts with its index's row count, which a partial index keeps below the table's;
+            # CAST reads that leading integer and MAX takes the full table (or a full index) over any partial one
+            result = self._read_catalog(
+                text("SELECT MAX(CAST(stat AS INTEGER)) AS row_count FROM sqlite_stat1 WHERE tbl = :tbl"),
+                tbl=table_name
+            )
+        except Exception:
+            return None  # ANALYZE has never run, so sqlite_stat1 does not exist
+        row_count = result.iloc[0]['row_count']
+        return None if pd.isna(row_count) else int(row_count)
+    
     def close(self):
         """Close database connection and cleanup temporary files."""
-        if self.engine:
+        # A shared engine stays open for other connectors and is disposed at exit
+        if self.engine and self.temp_db_path:
             self.engine.dispose()
-            logging.info("SQLite connection closed")
+        self.engine = None
+        logging.info("SQLite connection closed")
         
         # Clean up temporary database file if it exists
         if self.temp_db_path and os.path.exists(self.temp_db_path):
@@ -1,30 +1,222 @@
+import ast
+import builtins
 import pandas as pd
+import pyarrow as pa
 import plotly.express as px
 import plotly.graph_objects as go
+import plotly.io as pio
 from plotly.subplots import make_subplots
 import numpy as np
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Union
 import logging
 import os
+from functools import lru_cache
+from types import CodeType
 from langchain.chains import LLMChain
 from langchain_core.prompts import PromptTemplate
-from langchain_groq import ChatGroq
+from nlp.llm_factory import get_groq, DEFAULT_MODEL
+from nlp.llm_cache import LLMResponseCache
 from dotenv import load_dotenv
 import re
 
+try:
+    from numba import njit
+except ImportError:  # optional JIT, fall back to plain NumPy
+    def njit(*args, **kwargs):
+        return lambda func: func
+
+# Serialize figures with orjson (numpy arrays encoded natively) wherever
+# they are rendered, including st.plotly_chart
+try:
+    import orjson  # noqa: F401
+    pio.json.config.default_engine = "orjson"
+except ImportError:
+    pass
+
 # Load environment variables
 load_dotenv()
 
+# Code blocks in LLM replies, and layout keys plotly rejects
+_PYTHON_BLOCK_RE = re.compile(r'```python\s*(.*?)\s*```', re.DOTALL)
+_CODE_BLOCK_RE = re.compile(r'```\s*(.*?)\s*```', re.DOTALL)
+_INVALID_HOVER_RE = re.compile(r'\b(?:hover|hover_data)\s*=')
+
+
+# Builtins available to chart code; this keeps LLM mistakes contained, it is not a sandbox
+# (module attributes such as pd.read_pickle or DataFrame.to_csv are still reachable)
+_SAFE_BUILTINS = {
+    name: getattr(builtins, name) for name in (
+        "abs", "all", "any", "bool", "callable", "dict", "divmod", "enumerate", "filter", "float",
+        "format", "frozenset", "hash", "int", "isinstance", "issubclass", "iter",
+        "len", "list", "map", "max", "min", "next", "object", "pow", "print", "range", "repr",
+        "reversed", "round", "set", "slice", "sorted", "str", "sum", "tuple", "type", "zip",
+        "ArithmeticError", "AttributeError", "Exception", "IndexError", "KeyError", "LookupError",
+        "NameError", "RuntimeError", "StopIteration", "TypeError", "ValueError", "ZeroDivisionError"
+    )
+}
+
+
+def _getattr_no_dunder(obj, name, *default):
+    """getattr for chart code; dunder names stay blocked as they are for attribute syntax."""
+    if isinstance(name, str) and name.startswith("__"):
+        raise AttributeError(f"Access to {name} is not allowed in chart code")
+    return getattr(obj, name, *default)
+
+
+def _hasattr_no_dunder(obj, name) -> bool:
+    """hasattr for chart code, answering False for dunder names."""
+    try:
+        _getattr_no_dunder(obj, name)
+    except AttributeError:
+        return False
+    return True
+
+
+_SAFE_BUILTINS.update(getattr=_getattr_no_dunder, hasattr=_hasattr_no_dunder)
+
+# Modules chart code may import, with the only name each may be bound to; all are pre-imported
+_PROVIDED_IMPORTS = {
+    "pandas": "pd",
+    "numpy": "np",
+    "plotly.express": "px",
+    "plotly.graph_objects": "go",
+    "plotly.subplots.make_subplots": "make_subplots",
+}
+
+_EXEC_GLOBALS = {
+    "__builtins__": _SAFE_BUILTINS,
+    "pd": pd,
+    "np": np,
+    "px": px,
+    "go": go,
+    "make_subplots": make_subplots,
+}
+
+
+def _is_provided_import(node: ast.stmt) -> bool:
+    """Check that an import only re-binds one of the pre-imported names."""
+    if isinstance(node, ast.Import):
+        targets = [(alias.name, alias.asname or alias.name) for alias in node.names]
+    elif node.level == 0 and node.module:
+        targets = [(f"{node.module}.{alias.name}", alias.asname or alias.name) for alias in node.names]
+    else:
+        return False
+    return all(_PROVIDED_IMPORTS.get(module) == bound for module, bound in targets)
+
+
+class _DropImports(ast.NodeTransformer):
+    """Replace import statements, wherever they appear, with pass."""
+
+    def visit_Import(self, node):
+        return ast.copy_location(ast.Pass(), node)
+
+    visit_ImportFrom = visit_Import
+
+
+def _with_numpy_dtypes(df: pd.DataFrame) -> pd.DataFrame:
+    """Return df with Arrow-backed columns converted to the NumPy dtypes chart code is written against."""
+    positions = [i for i, dtype in enumerate(df.dtypes) if isinstance(dtype, pd.ArrowDtype)]
+    if not positions:
+        return df
+
+    # LLM-written code picks columns with select_dtypes and np.issubdtype, which misclassify Arrow columns;
+    # Arrow's own conversion gives what a NumPy read would (nullable ints as float, strings as object)
+    df = df.copy(deep=False)
+    for i in positions:
+        df.isetitem(i, pa.array(df.iloc[:, i].array).to_pandas().array)
+    return df
+
+
+@lru_cache(maxsize=256)
+def _compile_chart_code(code: str) -> CodeType:
+    """Validate and compile chart code once per distinct source string."""
+    tree = ast.parse(code, "<chart>", "exec")
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.Import, ast.ImportFrom)) and not _is_provided_import(node):
+            raise ValueError(f"Import not allowed in chart code: {ast.unparse(node)}")
+        if isinstance(node, ast.Attribute) and node.attr.startswith("__"):
+            raise ValueError(f"Access to {node.attr} is not allowed in chart code")
+        if isinstance(node, ast.Name) and node.id.startswith("__"):
+            raise ValueError(f"Use of {node.id} is not allowed in chart code")
+
+    # The allowed imports are already in the exec globals, so drop them instead of re-importing
+    tree = ast.fix_missing_locations(_DropImports().visit(tree))
+    return compile(tree, "<chart>", "exec")
+
+
+@njit(cache=True, fastmath=True)
+def _lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """Select n_out point indices with Largest-Triangle-Three-Buckets."""
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    # n_out - 2 buckets between the fixed first and last points
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    indices = np.empty(n_out, dtype=np.int64)
+    indices[0], indices[-1] = 0, n - 1
+
+    a = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[end:next_end].mean()
+        avg_y = y[end:next_end].mean()
+        area = np.abs(
+            (x[a] - avg_x) * (y[start:end] - y[a])
+            - (x[a] - x[start:end]) * (avg_y - y[a])
+        )
+        a = start + int(np.argmax(area))
+        indices[i + 1] = a
+    return indices
+
+
 class ChartGenerator:
     """Generate Python code for data visualization based on natural language prompts."""
 
+    # Traces longer than this are downsampled with LTTB before rendering
+    DOWNSAMPLE_THRESHOLD = 5000
+    DOWNSAMPLE_POINTS = 2000
+    # Scatter traces longer than this are rendered with WebGL (scattergl)
+    WEBGL_THRESHOLD = 1000
+    # Seconds generated chart code is reused for the same data shape and question
+    CODE_CACHE_TTL = 3600
+
+    EXPLANATION_TEMPLATE = """
+Explain this data visualization code in simple terms for a business user:
+
+Original Request: {query}
+Python Code: {code}
+
+Explain:
+1. Chart type
+2. Data being shown
+3. Insights user can get
+4. Special features
+
+Keep the explanation non-technical.
+
+Explanation:
+"""
+
     def __init__(self):
-        self.llm = ChatGroq(
-            model_name="llama3-70b-8192",
-            groq_api_key=os.getenv("GROQ_API_KEY"),
-            temperature=0.1
-        )
+        self.llm = get_groq(DEFAULT_MODEL, os.getenv("GROQ_API_KEY"))
         self.visualization_prompt = self._get_visualization_prompt()
+        # The prompt and chain do not depend on the data, so build them once
+        self.chart_chain = LLMChain(
+            llm=self.llm,
+            prompt=PromptTemplate(
+                input_variables=["columns", "dtypes", "sample_data", "shape", "query"],
+                template=self.visualization_prompt
+            )
+        )
+        self.explanation_chain = LLMChain(
+            llm=self.llm,
+            prompt=PromptTemplate(input_variables=["query", "code"], template=self.EXPLANATION_TEMPLATE)
+        )
+        # Generated code depends only on the data's columns/dtypes and the question
+        self._code_cache = LLMResponseCache(ttl=self.CODE_CACHE_TTL)
+        self._explanation_cache = LLMResponseCache()
 
     def _get_visualization_prompt(self) -> str:
         """Get the prompt template for generating visualization code."""
@@ -60,6 +252,7 @@ Chart Type Guidelines:
 - For relationships: Use scatter plots with trendlines
 - For proportions: Use pie charts or donut charts
 - For multiple variables: Use subplots or faceted charts
+- For more than 1000 points: pass render_mode='webgl' to px.scatter/px.line or use go.Scattergl
 
 Return ONLY the Python code without any markdown formatting or explanations.
 The code should be executable and create a complete visualization.
@@ -67,15 +260,26 @@ The code should be executable and create a complete visualization.
 Python Code:
 """
 
-    def generate_chart_code(self, df: pd.DataFrame, query: str) -> str:
-        try:
+    @staticmethod
+    def _normalize_query(query: str) -> str:
+        """Lowercase a chart request and collapse whitespace; punctuation such as < or - can change its meaning."""
+        return " ".join(query.lower().split())
+
+    def _code_cache_key(self, analysis: Dict[str, Any], query: str) -> bytes:
+        """Cache key for chart code generated for this data shape and question."""
+        return LLMResponseCache.make_key(repr(analysis["dtypes"]), self._normalize_query(query))
+
+    def generate_chart_code(self, df: pd.DataFrame, query: str,
+                            analysis: Optional[Dict[str, Any]] = None) -> str:
+        if analysis is None:
             analysis = self._analyze_dataframe(df)
-            prompt = PromptTemplate(
-                input_variables=["columns", "dtypes", "sample_data", "shape", "query"],
-                template=self.visualization_prompt
-            )
-            chain = LLMChain(llm=self.llm, prompt=prompt)
-            code_response = chain.run({
+        cache_key = self._code_cache_key(analysis, query)
+        cached = self._code_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        try:
+            code_response = self.chart_chain.run({
                 "columns": analysis["columns"],
                 "dtypes": analysis["dtypes"],
                 "sample_data": analysis["sample_data"],
@@ -83,21 +287,17 @@ Python Code:
                 "query": query
             })
             cleaned_code = self._clean_code(code_response)
+            self._code_cache.put(cache_key, cleaned_code)
             return cleaned_code
         except Exception as e:
             logging.error(f"Chart code generation failed: {str(e)}")
-            return self._generate_fallback_code(df, query)
+            return self._generate_fallback_code(df, query, analysis)
 
-    def execute_chart_code(self, df: pd.DataFrame, code: str) -> Optional[go.Figure]:
+    def execute_chart_code(self, df: pd.DataFrame, code: Union[str, CodeType]) -> Optional[go.Figure]:
         try:
-            exec_globals = {
-                'df': df,
-                'pd': pd,
-                'px': px,
-                'go': go,
-                'np': np,
-                'make_subplots': make_subplots
-            }
+            exec_globals = {**_EXEC_GLOBALS, 'df': df}
+            if isinstance(code, str):
+                code = _compile_chart_code(code)
             exec(code, exec_globals)
             if 'fig' in exec_globals:
                 return exec_globals['fig']
@@ -110,21 +310,104 @@ Python Code:
         if df.empty:
             return None
         try:
-            code = self.generate_chart_code(df, query)
-            return self.execute_chart_code(df, code)
+            # Query results are Arrow-backed; chart code sees the NumPy dtypes it expects
+            df = _with_numpy_dtypes(df)
+            analysis = self._analyze_dataframe(df)
+            cache_key = self._code_cache_key(analysis, query)
+            code = self.generate_chart_code(df, query, analysis)
+            try:
+                _compile_chart_code(code)
+            except (SyntaxError, ValueError) as e:
+                # Rejected code would fail the same way on every repeat, so forget it and chart the basics
+                logging.warning(f"Generated chart code rejected, using fallback chart: {str(e)}")
+                self._code_cache.discard(cache_key)
+                code = self._generate_fallback_code(df, query, analysis)
+            fig = self._render_chart(df, code)
+            if fig is None:
+                # Only code that renders is reused; a runtime failure gets a fresh attempt next time
+                self._code_cache.discard(cache_key)
+                logging.warning("Chart code did not produce a figure, using fallback chart")
+                fig = self._render_chart(df, self._generate_fallback_code(df, query, analysis))
+            return fig
         except Exception as e:
             logging.error(f"Chart generation failed: {str(e)}")
             return None
 
+    def _render_chart(self, df: pd.DataFrame, code: str) -> Optional[go.Figure]:
+        """Execute chart code and prepare the figure for rendering."""
+        fig = self.execute_chart_code(df, code)
+        if fig is not None:
+            self._downsample_traces(fig)
+            fig = self._use_webgl_traces(fig)
+        return fig
+
+    def _downsample_traces(self, fig: go.Figure) -> None:
+        """Downsample long x-sorted line/scatter traces in place using LTTB."""
+        for trace in fig.data:
+            if trace.type not in ('scatter', 'scattergl') or trace.x is None or trace.y is None:
+                continue
+            x = np.asarray(trace.x)
+            y = np.asarray(trace.y)
+            n = len(x)
+            if n <= self.DOWNSAMPLE_THRESHOLD or len(y) != n:
+                continue
+            try:
+                if np.issubdtype(x.dtype, np.datetime64):
+                    x_num = x.astype('datetime64[ns]').astype(np.int64).astype(float)
+                else:
+                    x_num = x.astype(float)
+                y_num = y.astype(float)
+            except (TypeError, ValueError):
+                continue  # categorical axis, leave untouched
+            if np.isnan(x_num).any() or np.isnan(y_num).any() or (np.diff(x_num) < 0).any():
+                continue  # LTTB needs complete, x-sorted series
+
+            keep = _lttb_indices(x_num, y_num, self.DOWNSAMPLE_POINTS)
+            updates = {'x': x[keep], 'y': y[keep]}
+            for attr in ('customdata', 'text', 'hovertext'):
+                values = getattr(trace, attr)
+                if values is not None and not isinstance(values, str) and len(values) == n:
+                    updates[attr] = np.asarray(values)[keep]
+            trace.update(updates)
+
+    def _use_webgl_traces(self, fig: go.Figure) -> go.Figure:
+        """Return fig with long SVG scatter traces swapped for their WebGL equivalent."""
+        traces = list(fig.data)
+        changed = False
+        for i, trace in enumerate(traces):
+            if trace.type != 'scatter' or trace.x is None or len(trace.x) <= self.WEBGL_THRESHOLD:
+                continue
+            props = trace.to_plotly_json()
+            props.pop('type', None)
+            try:
+                traces[i] = go.Scattergl(**props)
+                changed = True
+            except ValueError:
+                continue  # uses scatter-only properties (e.g. stackgroup), keep SVG
+        if not changed:
+            return fig
+        # fig.data only accepts its own traces, so the swapped ones go into a new figure
+        return go.Figure(data=traces, layout=fig.layout, frames=fig.frames)
+
     def _analyze_dataframe(self, df: pd.DataFrame) -> Dict[str, Any]:
+        # Bucket columns in one pass over the dtypes; kinds cover NumPy and Arrow-backed columns
+        numeric_cols, categorical_cols, datetime_cols = [], [], []
+        for column, dtype in df.dtypes.items():
+            if dtype.kind in 'iufcm':
+                numeric_cols.append(column)
+            elif dtype == object or pd.api.types.is_string_dtype(dtype):
+                categorical_cols.append(column)
+            elif dtype.kind == 'M':
+                datetime_cols.append(column)
+
         analysis = {
             'columns': list(df.columns),
             'dtypes': df.dtypes.astype(str).to_dict(),
             'shape': df.shape,
             'sample_data': df.head(3).to_dict('records'),
-            'numeric_cols': df.select_dtypes(include=[np.number]).columns.tolist(),
-            'categorical_cols': df.select_dtypes(include=['object']).columns.tolist(),
-            'datetime_cols': df.select_dtypes(include=['datetime64']).columns.tolist()
+            'numeric_cols': numeric_cols,
+            'categorical_cols': categorical_cols,
+            'datetime_cols': datetime_cols
         }
         return analysis
 
@@ -133,22 +416,16 @@ Python Code:
 
         # Extract only code if inside markdown
         if '```python' in code_response:
-            match = re.search(r'```python\s*(.*?)\s*```', code_response, re.DOTALL)
+            match = _PYTHON_BLOCK_RE.search(code_response)
             if match:
                 code_response = match.group(1)
         elif '```' in code_response:
-            match = re.search(r'```\s*(.*?)\s*```', code_response, re.DOTALL)
+            match = _CODE_BLOCK_RE.search(code_response)
             if match:
                 code_response = match.group(1)
 
-        lines = code_response.split('\n')
-        cleaned_lines = []
-        for line in lines:
-            if 'layout=' in line and 'hover=' in line:
-                continue  # remove bad layout lines
-            if 'hover=' in line or 'hover_data=' in line:
-                continue  # remove invalid hover properties
-            cleaned_lines.append(line)
+        # Remove lines setting invalid hover properties (including bad layout lines)
+        cleaned_lines = [line for line in code_response.split('\n') if not _INVALID_HOVER_RE.search(line)]
 
         cleaned_code = '\n'.join(cleaned_lines)
         if 'import' not in cleaned_code:
@@ -161,8 +438,10 @@ Python Code:
 
         return cleaned_code
 
-    def _generate_fallback_code(self, df: pd.DataFrame, query: str) -> str:
-        analysis = self._analyze_dataframe(df)
+    def _generate_fallback_code(self, df: pd.DataFrame, query: str,
+                                analysis: Optional[Dict[str, Any]] = None) -> str:
+        if analysis is None:
+            analysis = self._analyze_dataframe(df)
         if analysis['datetime_cols'] and analysis['numeric_cols']:
             x, y = analysis['datetime_cols'][0], analysis['numeric_cols'][0]
             return f"""
@@ -211,33 +490,24 @@ fig = go.Figure(data=[go.Table(
         fig.update_layout(title="Chart Generation Error")
         return fig
 
+    def clear_cache(self):
+        """Drop cached chart code and explanations."""
+        self._code_cache.clear()
+        self._explanation_cache.clear()
+
     def get_generated_code(self, df: pd.DataFrame, query: str) -> str:
         return self.generate_chart_code(df, query)
 
     def explain_chart_code(self, code: str, query: str) -> str:
-        try:
-            explanation_template = """
-Explain this data visualization code in simple terms for a business user:
-
-Original Request: {query}
-Python Code: {code}
-
-Explain:
-1. Chart type
-2. Data being shown
-3. Insights user can get
-4. Special features
+        cache_key = LLMResponseCache.make_key(code, self._normalize_query(query))
+        cached = self._explanation_cache.get(cache_key)
+        if cached is not None:
+            return cached
 
-Keep the explanation non-technical.
-
-Explanation:
-"""
-            prompt = PromptTemplate(
-                input_variables=["query", "code"],
-                template=explanation_template
-            )
-            chain = LLMChain(llm=self.llm, prompt=prompt)
-            return chain.run({"query": query, "code": code})
+        try:
+            explanation = self.explanation_chain.run({"query": query, "code": code})
+            self._explanation_cache.put(cache_key, explanation)
+            return explanation
         except Exception as e:
             logging.error(f"Code explanation failed: {str(e)}")
             return f"This code creates a visualization to answer: '{query}'"